@@ -2,6 +2,7 @@
 from typing import Optional
 import re
 import unicodedata
+from odoo_services.utils import cached_reference
 # address, sector mapping
 def sanitize_item(item):
     return {
@@ -54,32 +55,37 @@ def sanitize_float(value) -> float:
         return 0.0
 
    
-def get_country_id(models, db, uid, password, country_code: str) -> Optional[int]:
+def get_country_id(odoo, country_code: str) -> Optional[int]:
     if not country_code:
         return None
-    country_ids = models.execute_kw(
-        db, uid, password,
-        'res.country', 'search',
-        [[['code', '=', country_code]]],
-        {'limit': 1}
-    )
-    return country_ids[0] if country_ids else None
 
+    def _load():
+        country_ids = odoo.execute_kw(
+            'res.country', 'search',
+            [[['code', '=', country_code]]],
+            {'limit': 1}
+        )
+        return country_ids[0] if country_ids else None
+
+    return cached_reference(("country", country_code), _load)
 
-def get_state_id(models, db, uid, password, state_name: str, country_id: int) -> Optional[int]:
+
+def get_state_id(odoo, state_name: str, country_id: int) -> Optional[int]:
     if not state_name or not country_id:
         return None
 
-    state_ids = models.execute_kw(
-        db, uid, password,
-        'res.country.state', 'search',
-        [[
-            ['name', 'ilike', state_name],
-            ['country_id', '=', country_id]
-        ]],
-        {'limit': 1}
-    )
-    return state_ids[0] if state_ids else None
+    def _load():
+        state_ids = odoo.execute_kw(
+            'res.country.state', 'search',
+            [[
+                ['name', 'ilike', state_name],
+                ['country_id', '=', country_id]
+            ]],
+            {'limit': 1}
+        )
+        return state_ids[0] if state_ids else None
+
+    return cached_reference(("state", state_name, country_id), _load)
 
 
 def validate_category(category: str) -> Optional[str]:
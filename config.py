@@ -10,12 +10,35 @@ ODOO_URL = os.getenv("ODOO_URL")
 ODOO_DB = os.getenv("ODOO_DB")
 ODOO_USERNAME = os.getenv("ODOO_USERNAME")
 ODOO_PASSWORD = os.getenv("ODOO_PASSWORD")
+ODOO_RPC_PROTOCOL = os.getenv("ODOO_RPC_PROTOCOL", "jsonrpc")  # jsonrpc | xmlrpc
+ODOO_POOL_SIZE = int(os.getenv("ODOO_POOL_SIZE", "16"))  # keep-alive connections to Odoo
+ODOO_TIMEOUT = int(os.getenv("ODOO_TIMEOUT", "60"))  # seconds per RPC
 
 # Email / Microsoft Graph
 CLIENT_ID = os.getenv("CLIENT_ID")
 TENANT_ID = os.getenv("TENANT_ID")  
 SCOPES = json.loads(os.getenv("SCOPES", '["Mail.Read","Mail.Send"]'))  # convert string → list
 FROM_EMAIL = os.getenv("FROM_EMAIL")
+TOKEN_CACHE_PATH = os.getenv("TOKEN_CACHE_PATH", "token_cache.json")
+TOKEN_REFRESH_MARGIN = int(os.getenv("TOKEN_REFRESH_MARGIN", "300"))  # seconds before expiry to refresh
+
+GRAPH_PAGE_SIZE = int(os.getenv("GRAPH_PAGE_SIZE", "50"))  # messages per inbox page
+FETCH_ONLY_WITH_ATTACHMENTS = os.getenv("FETCH_ONLY_WITH_ATTACHMENTS", "True") == "True"
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "3"))  # failed ingests before an email is dead-lettered
+
+GRAPH_TIMEOUT = (10, int(os.getenv("GRAPH_READ_TIMEOUT", "60")))  # (connect, read) seconds
+GRAPH_MAX_RETRIES = int(os.getenv("GRAPH_MAX_RETRIES", "5"))  # on 429/503/504, honoring Retry-After
+GRAPH_POOL_SIZE = int(os.getenv("GRAPH_POOL_SIZE", "16"))
+GRAPH_BATCH_MAX_BYTES = int(os.getenv("GRAPH_BATCH_MAX_BYTES", str(16 * 1024 * 1024)))  # attachment bytes per $batch call
+LARGE_ATTACHMENT_BYTES = int(os.getenv("LARGE_ATTACHMENT_BYTES", str(4 * 1024 * 1024)))  # above this: streamed
+
+# Push ingestion: Graph change notifications (off unless GRAPH_NOTIFICATION_URL is set)
+GRAPH_NOTIFICATION_URL = os.getenv("GRAPH_NOTIFICATION_URL")  # public https URL of /graph/notifications
+GRAPH_CLIENT_STATE = os.getenv("GRAPH_CLIENT_STATE")  # shared secret echoed back in every notification
+GRAPH_SUBSCRIPTION_MINUTES = int(os.getenv("GRAPH_SUBSCRIPTION_MINUTES", "4230"))  # Graph max for messages is 10080
+GRAPH_SUBSCRIPTION_RENEW_MINUTES = int(os.getenv("GRAPH_SUBSCRIPTION_RENEW_MINUTES", "60"))  # renew this long before expiry
+PIPELINE_POLL_SECONDS = int(os.getenv("PIPELINE_POLL_SECONDS", "30"))  # polling without push
+SAFETY_POLL_SECONDS = int(os.getenv("SAFETY_POLL_SECONDS", "900"))  # polling when push is on
 
 MICROSOFT_CONFIG = {
     "client_id": CLIENT_ID,
@@ -32,6 +55,13 @@ KEY_FILE = os.getenv("KEY_FILE")
 BUCKET_NAME = os.getenv("BUCKET_NAME")
 NAMESPACE = os.getenv("NAMESPACE")
 COMPARTMENT_OCID = os.getenv("COMPARTMENT_OCID")
+STREAM_PART_SIZE = int(os.getenv("STREAM_PART_SIZE", str(10 * 1024 * 1024)))  # multipart part size in bytes
+STREAM_UPLOAD_PARALLEL = int(os.getenv("STREAM_UPLOAD_PARALLEL", "2"))  # parts in flight per upload
+
+# Image attachments
+IMAGE_DIRECT_OCR = os.getenv("IMAGE_DIRECT_OCR", "False") == "True"  # send PNG/JPG/TIFF to OCR without PDF conversion
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))  # processes for image → PDF conversion
+IMAGE_POOL_MIN_BYTES = int(os.getenv("IMAGE_POOL_MIN_BYTES", str(1024 * 1024)))  # smaller images convert inline
 
 OCI_CONFIG = {
     "user": OCI_USER,
@@ -47,11 +77,28 @@ OCI_CONFIG = {
 LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o")
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "500"))      # starting limits, corrected from response headers
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", "30000"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "sqlite")  # sqlite | oci | off
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite")
+LLM_CACHE_TTL_DAYS = int(os.getenv("LLM_CACHE_TTL_DAYS", "30"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
 
 # Feature toggles
 ENABLE_CLASSIFICATION = os.getenv("ENABLE_CLASSIFICATION", "False") == "True"
 ENABLE_OCR = os.getenv("ENABLE_OCR", "False") == "True"
 ENABLE_LLM_EXTRACTION = os.getenv("ENABLE_LLM_EXTRACTION", "False") == "True"
+ENABLE_OCR_BATCH = os.getenv("ENABLE_OCR_BATCH", "True") == "True"  # one Document AI job per SO folder
+OCR_BATCH_TIMEOUT = int(os.getenv("OCR_BATCH_TIMEOUT", "900"))  # seconds before falling back to per-file OCR
+
+# Pipeline
+STEP_TWO_WORKERS = int(os.getenv("STEP_TWO_WORKERS", "4"))  # SO folders processed concurrently
+ODOO_RFQ_WORKERS = int(os.getenv("ODOO_RFQ_WORKERS", "4"))  # vendor RFQs created concurrently per SO
+
+# Odoo reference data (currency, UoM, tax, payment term, country, state, category)
+REFERENCE_CACHE_TTL = int(os.getenv("REFERENCE_CACHE_TTL", "3600"))  # seconds
+REFERENCE_CACHE_WARMUP = os.getenv("REFERENCE_CACHE_WARMUP", "False") == "True"
 
 # Logging
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
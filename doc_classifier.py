@@ -2,6 +2,11 @@ import os
 import mimetypes
 import pdfplumber
 
+PDF_TEXT = "PDF (text-based)"
+PDF_SCANNED = "PDF (scanned/image)"
+IMAGE = "Image"
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.tif', '.tiff']  # images Document AI OCRs directly
+
 def classify_file(file_path):
     mime_type, _ = mimetypes.guess_type(file_path)
     ext = os.path.splitext(file_path)[1].lower()
@@ -9,18 +14,50 @@ def classify_file(file_path):
     if ext == '.pdf':
         try:
             with pdfplumber.open(file_path) as pdf:
-                text = ""
+                # one page with text is enough to call it text-based
                 for page in pdf.pages:
-                    text += page.extract_text() or ""
-                if text.strip():
-                    return "PDF (text-based)"
-                else:
-                    return "PDF (scanned/image)"
+                    if (page.extract_text() or "").strip():
+                        return PDF_TEXT
+                return PDF_SCANNED
         except Exception as e:
             return f"PDF (error reading): {str(e)}"
 
-    elif ext in ['.jpg', '.jpeg', '.png', '.tif', '.tiff']:
-        return "Image"
+    elif ext in IMAGE_EXTENSIONS:
+        return IMAGE
 
     else:
         return f"Unknown or unsupported format: {mime_type or ext}"
+
+def analyze_document(file_path):
+    """
+    Classifies the file and extracts its text in a single pdfplumber pass.
+    Returns {"file_type", "text", "pages": [{"page", "has_text", "scanned"}]}.
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext != '.pdf':
+        return {"file_type": classify_file(file_path), "text": "", "pages": []}
+
+    try:
+        with pdfplumber.open(file_path) as pdf:
+            file_type = None
+            text = ""
+            pages = []
+            for number, page in enumerate(pdf.pages, start=1):
+                page_text = page.extract_text() or ""
+                has_text = bool(page_text.strip())
+                pages.append({
+                    "page": number,
+                    "has_text": has_text,
+                    "scanned": not has_text and bool(page.images),
+                })
+                text += page_text
+                if has_text and file_type is None:
+                    file_type = PDF_TEXT
+    except Exception as e:
+        return {"file_type": f"PDF (error reading): {str(e)}", "text": "", "pages": []}
+
+    return {
+        "file_type": file_type or PDF_SCANNED,
+        "text": text.strip() if file_type else "",
+        "pages": pages,
+    }
@@ -0,0 +1,80 @@
+import argparse
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+from config import GRAPH_CLIENT_STATE
+from graph_subscriptions import SUBSCRIPTION_RESOURCE
+
+# --- Local stand-in for Microsoft Graph change notifications ---
+# Sends the same POSTs Graph would send to /graph/notifications, so the webhook can be
+# exercised against a local uvicorn without a public URL or a real subscription:
+#   python fake_graph_notifier.py validate
+#   python fake_graph_notifier.py created <message_id> [<message_id> ...]
+#   python fake_graph_notifier.py lifecycle missed
+DEFAULT_URL = "http://localhost:80/graph/notifications"
+
+def send_validation(url):
+    token = f"fake-validation-{uuid.uuid4()}"
+    response = requests.post(url, params={"validationToken": token}, timeout=10)
+    ok = response.status_code == 200 and response.text == token
+    print(f"{'✅' if ok else '❌'} validation → HTTP {response.status_code}: {response.text!r}")
+    return ok
+
+def build_created_notification(message_id, subscription_id, client_state):
+    return {
+        "subscriptionId": subscription_id,
+        "subscriptionExpirationDateTime": (datetime.now(timezone.utc) + timedelta(days=2)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "changeType": "created",
+        "resource": f"Users/me/Messages/{message_id}",
+        "resourceData": {
+            "@odata.type": "#Microsoft.Graph.Message",
+            "@odata.id": f"Users/me/Messages/{message_id}",
+            "id": message_id,
+        },
+        "clientState": client_state,
+        "tenantId": "00000000-0000-0000-0000-000000000000",
+    }
+
+def build_lifecycle_notification(event, subscription_id, client_state):
+    return {
+        "subscriptionId": subscription_id,
+        "lifecycleEvent": event,
+        "resource": SUBSCRIPTION_RESOURCE,
+        "clientState": client_state,
+        "organizationId": "00000000-0000-0000-0000-000000000000",
+    }
+
+def send_notifications(url, notifications):
+    response = requests.post(url, json={"value": notifications}, timeout=10)
+    ok = response.status_code == 202
+    print(f"{'✅' if ok else '❌'} {len(notifications)} notifications → HTTP {response.status_code}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="Send fake Graph change notifications to the local webhook")
+    parser.add_argument("--url", default=DEFAULT_URL)
+    parser.add_argument("--client-state", default=GRAPH_CLIENT_STATE or "",
+                        help="defaults to GRAPH_CLIENT_STATE; pass a wrong value to test rejection")
+    parser.add_argument("--subscription-id", default="fake-subscription")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("validate")
+    created = sub.add_parser("created")
+    created.add_argument("message_ids", nargs="+")
+    lifecycle = sub.add_parser("lifecycle")
+    lifecycle.add_argument("event", choices=["reauthorizationRequired", "subscriptionRemoved", "missed"])
+    args = parser.parse_args()
+
+    if args.command == "validate":
+        send_validation(args.url)
+    elif args.command == "created":
+        send_notifications(args.url, [
+            build_created_notification(message_id, args.subscription_id, args.client_state)
+            for message_id in args.message_ids
+        ])
+    else:
+        send_notifications(args.url, [build_lifecycle_notification(args.event, args.subscription_id, args.client_state)])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import GRAPH_MAX_RETRIES, GRAPH_POOL_SIZE, GRAPH_TIMEOUT
+
+# --- Microsoft Graph HTTP client ---
+# One pooled session for all Graph traffic: connections to graph.microsoft.com are
+# reused, every call has a timeout, and throttled calls are retried after Retry-After.
+RETRY_STATUSES = (429, 503, 504)
+
+def _retryable(method, status):
+    # a 503/504 POST (e.g. /reply) may already have been carried out; only a 429
+    # guarantees it was not, so anything but GET is resent on 429 alone
+    if method.upper() == "GET":
+        return status in RETRY_STATUSES
+    return status == 429
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_graph_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=GRAPH_POOL_SIZE)
+            session.mount("https://", adapter)
+            _session = session
+    return _session
+
+def _retry_delay(response, attempt):
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return float(retry_after)
+    return (2 ** attempt) + random.uniform(0, 1)
+
+def _refresh_authorization(headers):
+    # imported here: outlook_to_oci itself imports this module
+    from outlook_to_oci import refresh_outlook_token
+
+    authorization = (headers or {}).get("Authorization", "")
+    if not authorization.startswith("Bearer "):
+        return False
+    token = refresh_outlook_token(authorization[len("Bearer "):])
+    if not token:
+        return False
+    # updated in place, so callers reusing the dict (e.g. graph_batch chunks) send the new token too
+    headers["Authorization"] = f"Bearer {token}"
+    return True
+
+def graph_request(method, url, max_retries=None, timeout=None, **kwargs):
+    max_retries = GRAPH_MAX_RETRIES if max_retries is None else max_retries
+    timeout = timeout or GRAPH_TIMEOUT
+    session = get_graph_session()
+    reauthenticated = False
+
+    for attempt in range(max_retries + 1):
+        try:
+            response = session.request(method, url, timeout=timeout, **kwargs)
+            # expired or revoked token: refresh once and resend (a 401 was never carried out)
+            if response.status_code == 401 and not reauthenticated and _refresh_authorization(kwargs.get("headers")):
+                reauthenticated = True
+                print(f"[🔐 Graph] 401 on {method} {url} — retrying with a fresh token")
+                response.close()
+                response = session.request(method, url, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            # only GETs are safe to resend blindly
+            if method.upper() != "GET" or attempt == max_retries:
+                raise
+            delay = _retry_delay(None, attempt)
+            print(f"[⏳ Graph retry {attempt+1}] {method} {url} — {e.__class__.__name__}, waiting {delay:.1f}s")
+            time.sleep(delay)
+            continue
+
+        if _retryable(method, response.status_code) and attempt < max_retries:
+            delay = _retry_delay(response, attempt)
+            print(f"[⏳ Graph retry {attempt+1}] {method} {url} — HTTP {response.status_code}, waiting {delay:.1f}s")
+            response.close()
+            time.sleep(delay)
+            continue
+        return response
+
+def graph_get(url, **kwargs):
+    return graph_request("GET", url, **kwargs)
+
+def graph_post(url, **kwargs):
+    return graph_request("POST", url, **kwargs)
+
+def graph_patch(url, **kwargs):
+    return graph_request("PATCH", url, **kwargs)
+
+# --- JSON $batch ---
+GRAPH_BATCH_URL = "https://graph.microsoft.com/v1.0/$batch"
+GRAPH_BATCH_LIMIT = 20  # sub-requests per $batch call (Graph limit)
+
+def graph_batch(batch_requests, headers, max_retries=None):
+    """
+    Sends sub-requests ({"id", "method", "url", optional "body"/"headers"}, url relative
+    to /v1.0) in $batch calls of up to 20. Throttled sub-requests are resent after
+    their Retry-After (non-GET ones only on 429, as in graph_request).
+    Returns {id: {"status", "headers", "body"}}. A rejected $batch call passes its
+    own status to each of its sub-requests; a sub-request that could not be sent
+    at all (connection error, timeout) gets status 0 and the error text as body.
+    """
+    max_retries = GRAPH_MAX_RETRIES if max_retries is None else max_retries
+    batch_headers = {**headers, "Content-Type": "application/json"}
+    results = {}
+    pending = list(batch_requests)
+
+    for attempt in range(max_retries + 1):
+        retry, delay = [], 0.0
+        for start in range(0, len(pending), GRAPH_BATCH_LIMIT):
+            chunk = pending[start:start + GRAPH_BATCH_LIMIT]
+            by_id = {r["id"]: r for r in chunk}
+            try:
+                response = graph_post(GRAPH_BATCH_URL, headers=batch_headers, json={"requests": chunk})
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # the other chunks still go out; the caller decides what to resend
+                for r in chunk:
+                    results[r["id"]] = {"status": 0, "headers": {}, "body": f"{e.__class__.__name__}: {e}"}
+                continue
+            if response.status_code != 200:
+                for r in chunk:
+                    results[r["id"]] = {"status": response.status_code, "headers": {}, "body": response.text}
+                continue
+            for item in response.json().get("responses", []):
+                if _retryable(by_id[item["id"]]["method"], item.get("status")) and attempt < max_retries:
+                    retry.append(by_id[item["id"]])
+                    retry_after = (item.get("headers") or {}).get("Retry-After", "")
+                    delay = max(delay, float(retry_after) if retry_after.isdigit() else 2 ** attempt)
+                    continue
+                results[item["id"]] = item
+        if not retry:
+            break
+        print(f"[⏳ Graph batch retry {attempt+1}] {len(retry)} throttled sub-requests, waiting {delay:.1f}s")
+        time.sleep(delay)
+        pending = retry
+
+    return results
@@ -0,0 +1,151 @@
+import hmac
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import oci
+
+from config import (
+    GRAPH_CLIENT_STATE,
+    GRAPH_NOTIFICATION_URL,
+    GRAPH_SUBSCRIPTION_MINUTES,
+    GRAPH_SUBSCRIPTION_RENEW_MINUTES,
+)
+from graph_client import graph_patch, graph_post
+from oci_utils import get_namespace, get_oci_client
+from outlook_to_oci import get_outlook_token
+
+# --- Graph change notifications for new inbox messages ---
+# One subscription per deployment. Its id and expiry live in the bucket next to the
+# delta link, so a restart renews the existing subscription instead of adding one.
+SUBSCRIPTION_OBJECT = "metadata/graph_subscription.json"
+SUBSCRIPTION_RESOURCE = "me/mailFolders('inbox')/messages"
+SUBSCRIPTIONS_URL = "https://graph.microsoft.com/v1.0/subscriptions"
+
+_subscription = None  # {"id", "expires_at"}
+_subscription_lock = threading.Lock()
+
+def push_enabled():
+    return bool(GRAPH_NOTIFICATION_URL and GRAPH_CLIENT_STATE)
+
+def _headers(config):
+    ms = config["microsoft"]
+    token = get_outlook_token(
+        client_id=ms["client_id"],
+        tenant_id=ms["tenant_id"],
+        scopes=ms["scopes"]
+    )
+    return {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'}
+
+def _expiration(minutes):
+    expires = datetime.now(timezone.utc) + timedelta(minutes=minutes)
+    return expires.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def _parse_expiration(value):
+    # Graph returns e.g. 2026-10-20T10:00:00.0000000Z; seconds precision is plenty
+    parsed = datetime.strptime(value[:19], "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+def load_subscription(bucket_name, config):
+    client = get_oci_client(config)
+    namespace = get_namespace(client)
+    try:
+        obj = client.get_object(namespace, bucket_name, SUBSCRIPTION_OBJECT)
+        return json.loads(obj.data.content.decode("utf-8"))
+    except oci.exceptions.ServiceError as e:
+        if e.status == 404:
+            return None
+        else:
+            raise
+
+def save_subscription(bucket_name, config, subscription):
+    client = get_oci_client(config)
+    namespace = get_namespace(client)
+    client.put_object(namespace, bucket_name, SUBSCRIPTION_OBJECT, json.dumps(subscription).encode("utf-8"))
+
+def create_subscription(headers):
+    payload = {
+        "changeType": "created",
+        "notificationUrl": GRAPH_NOTIFICATION_URL,
+        "lifecycleNotificationUrl": GRAPH_NOTIFICATION_URL,
+        "resource": SUBSCRIPTION_RESOURCE,
+        "expirationDateTime": _expiration(GRAPH_SUBSCRIPTION_MINUTES),
+        "clientState": GRAPH_CLIENT_STATE,
+    }
+    # Graph validates notificationUrl (validationToken round-trip) before answering
+    response = graph_post(SUBSCRIPTIONS_URL, headers=headers, json=payload)
+    if response.status_code != 201:
+        raise Exception(f"Failed to create Graph subscription: {response.text}")
+    body = response.json()
+    return {"id": body["id"], "expires_at": _parse_expiration(body["expirationDateTime"])}
+
+def renew_subscription(headers, subscription_id):
+    # also re-authorizes the subscription after a reauthorizationRequired event
+    response = graph_patch(
+        f"{SUBSCRIPTIONS_URL}/{subscription_id}",
+        headers=headers,
+        json={"expirationDateTime": _expiration(GRAPH_SUBSCRIPTION_MINUTES)},
+    )
+    if response.status_code == 404:
+        return None  # expired or removed on Graph's side
+    if response.status_code != 200:
+        raise Exception(f"Failed to renew Graph subscription {subscription_id}: {response.text}")
+    return {"id": subscription_id, "expires_at": _parse_expiration(response.json()["expirationDateTime"])}
+
+def ensure_subscription(config, force_renew=False, recreate=False):
+    """
+    Makes sure a subscription exists and is not within GRAPH_SUBSCRIPTION_RENEW_MINUTES
+    of expiring: renews it, or creates a new one when Graph no longer knows it.
+    Safe to call from the scheduler as often as you like.
+    """
+    global _subscription
+    if not push_enabled():
+        return None
+
+    oci_cfg = config["oci"]
+    bucket_name = oci_cfg["bucket_name"]
+    with _subscription_lock:
+        if _subscription is None and not recreate:
+            _subscription = load_subscription(bucket_name, oci_cfg)
+
+        renew_at = time.time() + GRAPH_SUBSCRIPTION_RENEW_MINUTES * 60
+        if _subscription and not recreate and not force_renew and _subscription["expires_at"] > renew_at:
+            return _subscription
+
+        headers = _headers(config)
+        subscription = None
+        if _subscription and not recreate:
+            subscription = renew_subscription(headers, _subscription["id"])
+            if subscription:
+                print(f"🔔 Renewed Graph subscription {subscription['id']}")
+        if subscription is None:
+            subscription = create_subscription(headers)
+            print(f"🔔 Created Graph subscription {subscription['id']}")
+
+        save_subscription(bucket_name, oci_cfg, subscription)
+        _subscription = subscription
+        return _subscription
+
+def is_valid_notification(notification):
+    # clientState is the only proof the POST came from our subscription
+    client_state = notification.get("clientState") or ""
+    return bool(GRAPH_CLIENT_STATE) and hmac.compare_digest(client_state, GRAPH_CLIENT_STATE)
+
+def parse_notifications(payload):
+    """
+    Splits a notification POST body into (message_ids, lifecycle_events). Entries
+    with the wrong clientState are dropped and reported.
+    """
+    message_ids, lifecycle_events = [], []
+    for notification in payload.get("value", []):
+        if not is_valid_notification(notification):
+            print(f"[⚠️ Rejected Graph notification] subscription {notification.get('subscriptionId')}")
+            continue
+        if notification.get("lifecycleEvent"):
+            lifecycle_events.append(notification["lifecycleEvent"])
+            continue
+        message_id = (notification.get("resourceData") or {}).get("id")
+        if message_id:
+            message_ids.append(message_id)
+    return message_ids, lifecycle_events
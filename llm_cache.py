@@ -0,0 +1,188 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+import oci
+
+from config import (
+    BUCKET_NAME,
+    LLM_CACHE_BACKEND,
+    LLM_CACHE_MAX_ENTRIES,
+    LLM_CACHE_PATH,
+    LLM_CACHE_TTL_DAYS,
+    OCI_CONFIG,
+)
+from oci_utils import get_namespace, get_oci_client
+
+OCI_CACHE_PREFIX = "cache/llm/"
+
+_stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+_stats_lock = threading.Lock()
+
+def _count(name, n=1):
+    with _stats_lock:
+        _stats[name] += n
+
+def get_cache_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+def make_cache_key(raw_text, prompt_version, model):
+    # same text + same prompt + same model → same extraction
+    digest = hashlib.sha256()
+    for part in (prompt_version, model, raw_text):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class SQLiteCache:
+    def __init__(self, path, ttl_seconds, max_entries):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if not row:
+                return None
+            value, created = row
+            if now - created > self.ttl_seconds:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                _count("evictions")
+                return None
+            self._conn.execute("UPDATE llm_cache SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return json.loads(value)
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            )
+            evicted = self._conn.execute(
+                "DELETE FROM llm_cache WHERE created < ?", (now - self.ttl_seconds,)
+            ).rowcount
+            # keep only the most recently used max_entries rows
+            evicted += self._conn.execute(
+                "DELETE FROM llm_cache WHERE key NOT IN"
+                " (SELECT key FROM llm_cache ORDER BY accessed DESC LIMIT ?)",
+                (self.max_entries,),
+            ).rowcount
+            self._conn.commit()
+        if evicted:
+            _count("evictions", evicted)
+
+
+class OCIObjectCache:
+    # Shared between replicas; entries live under cache/llm/<key>.json in the bucket
+    def __init__(self, oci_cfg, bucket_name, ttl_seconds, max_entries, evict_every=50):
+        self.oci_cfg = oci_cfg
+        self.bucket_name = bucket_name
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.evict_every = evict_every
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _object_name(self, key):
+        return f"{OCI_CACHE_PREFIX}{key}.json"
+
+    def get(self, key):
+        client = get_oci_client(self.oci_cfg)
+        namespace = get_namespace(client)
+        try:
+            obj = client.get_object(namespace, self.bucket_name, self._object_name(key))
+        except oci.exceptions.ServiceError as e:
+            if e.status == 404:
+                return None
+            raise
+        entry = json.loads(obj.data.content.decode("utf-8"))
+        if time.time() - entry["created"] > self.ttl_seconds:
+            client.delete_object(namespace, self.bucket_name, self._object_name(key))
+            _count("evictions")
+            return None
+        return entry["value"]
+
+    def set(self, key, value):
+        client = get_oci_client(self.oci_cfg)
+        namespace = get_namespace(client)
+        entry = {"created": time.time(), "value": value}
+        client.put_object(namespace, self.bucket_name, self._object_name(key), json.dumps(entry).encode("utf-8"))
+
+        # listing the prefix is not free, so size/TTL eviction runs every few writes
+        with self._lock:
+            self._writes += 1
+            if self._writes % self.evict_every:
+                return
+        self._evict(client, namespace)
+
+    def _evict(self, client, namespace):
+        objects = oci.pagination.list_call_get_all_results(
+            client.list_objects, namespace, self.bucket_name,
+            prefix=OCI_CACHE_PREFIX, fields="name,timeCreated"
+        ).data.objects
+        objects.sort(key=lambda o: o.time_created, reverse=True)
+        cutoff = time.time() - self.ttl_seconds
+        stale = [o for o in objects if o.time_created.timestamp() < cutoff]
+        stale_names = {o.name for o in stale}
+        stale += [o for o in objects[self.max_entries:] if o.name not in stale_names]
+        for o in stale:
+            client.delete_object(namespace, self.bucket_name, o.name)
+        if stale:
+            _count("evictions", len(stale))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_llm_cache():
+    global _cache
+    if LLM_CACHE_BACKEND == "off":
+        return None
+    with _cache_lock:
+        if _cache is None:
+            ttl_seconds = LLM_CACHE_TTL_DAYS * 86400
+            if LLM_CACHE_BACKEND == "oci":
+                _cache = OCIObjectCache({"bucket_name": BUCKET_NAME, **OCI_CONFIG}, BUCKET_NAME, ttl_seconds, LLM_CACHE_MAX_ENTRIES)
+            else:
+                _cache = SQLiteCache(LLM_CACHE_PATH, ttl_seconds, LLM_CACHE_MAX_ENTRIES)
+    return _cache
+
+def cache_get(key):
+    cache = get_llm_cache()
+    if cache is None:
+        return None
+    try:
+        value = cache.get(key)
+    except Exception as e:
+        print(f"[⚠️ LLM cache read failed] {e}")
+        value = None
+    _count("hits" if value is not None else "misses")
+    return value
+
+def cache_set(key, value):
+    cache = get_llm_cache()
+    if cache is None:
+        return
+    try:
+        cache.set(key, value)
+        _count("writes")
+    except Exception as e:
+        print(f"[⚠️ LLM cache write failed] {e}")
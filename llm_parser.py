@@ -1,13 +1,18 @@
+import asyncio
+import hashlib
 import json
 import random
 import re
+import threading
 import time
 
-from openai import OpenAI, RateLimitError
+from openai import APIConnectionError, APITimeoutError, AsyncOpenAI, InternalServerError, RateLimitError
 
-from config import OPENAI_API_KEY, OPENAI_MODEL
+from config import LLM_MAX_CONCURRENCY, OPENAI_API_KEY, OPENAI_MODEL, OPENAI_RPM, OPENAI_TPM
+from llm_services.llm_cache import cache_get, cache_set, make_cache_key
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+SYSTEM_PROMPT = "You are a smart assistant that extracts procurement data into structured format."
+EXPECTED_COMPLETION_TOKENS = 2000  # reserved per call until the real usage is known
 
 prompt_template = """
 You are an intelligent assistant that extracts structured data from procurement documents.
@@ -83,37 +88,121 @@ Here is the input text:
 <INSERT RAW QUOTATION TEXT HERE>
 """
 
-def extract_quotation_data(raw_text: str) -> dict:
-    prompt = prompt_template.replace("<INSERT RAW QUOTATION TEXT HERE>", raw_text)
-    
-    max_retries = 5
-    response = None
+# Any edit to the prompts changes this, so cached extractions of the old prompt are not reused
+PROMPT_VERSION = hashlib.sha256((SYSTEM_PROMPT + prompt_template).encode("utf-8")).hexdigest()[:12]
 
-    for attempt in range(max_retries):
+# === RATE LIMITING ===
+def _parse_reset(value):
+    # OpenAI reset headers look like "1s", "6m0s", "20ms"
+    if not value:
+        return None
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    matches = re.findall(r"(\d+(?:\.\d+)?)(ms|s|m|h)", value)
+    if not matches:
         try:
-            response = client.chat.completions.create(
-                model=OPENAI_MODEL,
-                messages=[
-                    {"role": "system", "content": "You are a smart assistant that extracts procurement data into structured format."},
-                    {"role": "user", "content": prompt}
-                ]
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(n) * units[u] for n, u in matches)
+
+class _TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.available = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) * 60 / self.capacity
+
+    def take(self, amount):
+        self.available -= amount
+
+    def sync(self, limit, remaining):
+        if limit:
+            self.capacity = float(limit)
+        if remaining is not None:
+            self.available = min(self.available, float(remaining))
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute buckets, kept in line with the
+    x-ratelimit-* headers of every response. Only used from the LLM event loop.
+    """
+    def __init__(self, rpm, tpm):
+        self.requests = _TokenBucket(rpm)
+        self.tokens = _TokenBucket(tpm)
+        self.blocked_until = 0.0
+
+    async def acquire(self, tokens):
+        while True:
+            now = time.monotonic()
+            wait = max(
+                self.blocked_until - now,
+                self.requests.wait_time(1, now),
+                self.tokens.wait_time(tokens, now),
             )
-            break  # success
-           
-        except RateLimitError as e:
-            wait_time = (2 ** attempt) + random.uniform(0, 1)
-            print(f"[⏳ Retry {attempt+1}] Rate limit hit — waiting {wait_time:.2f} seconds...")
-            time.sleep(wait_time)
-            
-        except Exception as e:
-            print(f"[❌ ERROR] Failed to call OpenAI API: {e}")
-            return {}
+            if wait <= 0:
+                self.requests.take(1)
+                self.tokens.take(tokens)
+                return
+            await asyncio.sleep(wait)
 
-    if not response:
-        print("[🚫 Failed] No response from OpenAI.")
-        return {}
-  
-    result_text = response.choices[0].message.content.strip()
+    def settle(self, reserved, used):
+        # give back (or charge) the difference between the estimate and real usage
+        self.tokens.take(used - reserved)
+
+    def update_from_headers(self, headers):
+        def _int(name):
+            value = headers.get(name)
+            return int(value) if value and value.isdigit() else None
+
+        self.requests.sync(_int("x-ratelimit-limit-requests"), _int("x-ratelimit-remaining-requests"))
+        self.tokens.sync(_int("x-ratelimit-limit-tokens"), _int("x-ratelimit-remaining-tokens"))
+
+    def block_for(self, headers):
+        # 429: hold every caller until the provider says the window is open again
+        delay = (
+            _parse_reset(headers.get("retry-after"))
+            or max(_parse_reset(headers.get("x-ratelimit-reset-requests")) or 0,
+                   _parse_reset(headers.get("x-ratelimit-reset-tokens")) or 0)
+            or 1.0
+        )
+        self.blocked_until = max(self.blocked_until, time.monotonic() + delay + random.uniform(0, 0.5))
+        return delay
+
+# All async LLM calls run on one background event loop, so the client, the
+# semaphore and the limiter are shared by every pipeline thread.
+_loop = None
+_loop_lock = threading.Lock()
+_async_client = None
+_semaphore = None
+_limiter = None
+
+def _get_loop():
+    global _loop, _async_client, _semaphore, _limiter
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="llm-loop", daemon=True).start()
+            # no SDK retries: every 429 has to reach RateLimiter.block_for;
+            # transient errors are retried in _extract_async instead
+            _async_client = AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0)
+            _semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+            _limiter = RateLimiter(OPENAI_RPM, OPENAI_TPM)
+            _loop = loop
+    return _loop
+
+# === EXTRACTION ===
+def _parse_llm_response(result_text):
+    result_text = result_text.strip()
 
     # 🔧 Strip triple backticks if present
     if result_text.startswith("```"):
@@ -126,3 +215,72 @@ def extract_quotation_data(raw_text: str) -> dict:
         print("[⚠️ WARNING] Response not in JSON format")
         return {"raw_response": result_text}
 
+async def _extract_async(raw_text: str, max_retries: int = 5) -> dict:
+    # runs only on the llm-loop: the client, semaphore and limiter belong to it
+    cache_key = make_cache_key(raw_text, PROMPT_VERSION, OPENAI_MODEL)
+    cached = await asyncio.to_thread(cache_get, cache_key)
+    if cached is not None:
+        print("[♻️ LLM cache hit] Reusing previous extraction")
+        return cached
+
+    prompt = prompt_template.replace("<INSERT RAW QUOTATION TEXT HERE>", raw_text)
+    reserved = (len(SYSTEM_PROMPT) + len(prompt)) // 4 + EXPECTED_COMPLETION_TOKENS
+    response = None
+
+    async with _semaphore:
+        for attempt in range(max_retries):
+            await _limiter.acquire(reserved)
+            try:
+                raw = await _async_client.chat.completions.with_raw_response.create(
+                    model=OPENAI_MODEL,
+                    messages=[
+                        {"role": "system", "content": SYSTEM_PROMPT},
+                        {"role": "user", "content": prompt}
+                    ]
+                )
+                _limiter.update_from_headers(raw.headers)
+                response = raw.parse()
+                if response.usage:
+                    _limiter.settle(reserved, response.usage.total_tokens)
+                break  # success
+
+            except RateLimitError as e:
+                wait_time = _limiter.block_for(e.response.headers)
+                print(f"[⏳ Retry {attempt+1}] Rate limit hit — provider window resets in {wait_time:.2f} seconds")
+
+            except (APIConnectionError, APITimeoutError, InternalServerError) as e:
+                # transient: the SDK's own retries are off, so back off here
+                wait_time = (2 ** attempt) + random.uniform(0, 1)
+                print(f"[⏳ Retry {attempt+1}] {e.__class__.__name__} — retrying in {wait_time:.2f} seconds")
+                await asyncio.sleep(wait_time)
+
+            except Exception as e:
+                print(f"[❌ ERROR] Failed to call OpenAI API: {e}")
+                return {}
+
+    if not response:
+        print("[🚫 Failed] No response from OpenAI.")
+        return {}
+
+    result = _parse_llm_response(response.choices[0].message.content)
+    if result and "raw_response" not in result:
+        await asyncio.to_thread(cache_set, cache_key, result)
+    return result
+
+def extract_quotation_data_many(raw_texts) -> list:
+    """
+    Extracts many documents concurrently; blocks the calling thread until all are done.
+    Results are returned in the order of raw_texts.
+    """
+    raw_texts = list(raw_texts)
+    if not raw_texts:
+        return []
+    loop = _get_loop()
+
+    async def _gather():
+        return await asyncio.gather(*(_extract_async(t) for t in raw_texts))
+
+    return asyncio.run_coroutine_threadsafe(_gather(), loop).result()
+
+def extract_quotation_data(raw_text: str) -> dict:
+    return extract_quotation_data_many([raw_text])[0]
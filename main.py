@@ -1,20 +1,139 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import PlainTextResponse
 from apscheduler.schedulers.background import BackgroundScheduler
 import threading
-from run_pipeline import run_full_pipeline
+from config import PIPELINE_POLL_SECONDS, REFERENCE_CACHE_WARMUP, SAFETY_POLL_SECONDS
+from graph_subscriptions import ensure_subscription, parse_notifications, push_enabled
+from run_pipeline import build_config, run_full_pipeline
+from odoo_services.utils import get_odoo_session, warm_reference_cache
 
 app = FastAPI()
 
+@app.on_event("startup")
+def warm_caches():
+    # optional: preload Odoo reference data without delaying startup
+    if REFERENCE_CACHE_WARMUP:
+        threading.Thread(target=lambda: warm_reference_cache(get_odoo_session()), daemon=True).start()
+
+@app.on_event("startup")
+def start_subscription():
+    # Graph validates the webhook while we subscribe, so this must not block startup
+    if push_enabled():
+        threading.Thread(target=refresh_subscription, daemon=True).start()
+
 @app.get("/")
 def root():
     return {"message": "Hello from FastAPI 2"}
 
+@app.post("/graph/notifications")
+async def graph_notifications(request: Request):
+    # subscription handshake: echo the token back as plain text within 10 seconds
+    validation_token = request.query_params.get("validationToken")
+    if validation_token is not None:
+        return PlainTextResponse(validation_token)
+
+    try:
+        payload = await request.json()
+    except ValueError:
+        return Response(status_code=400)
+    message_ids, lifecycle_events = parse_notifications(payload)
+
+    # answer within 3 seconds or Graph retries and eventually drops the subscription
+    for event in lifecycle_events:
+        print(f"🔔 Graph lifecycle event: {event}")
+        if event == "reauthorizationRequired":
+            threading.Thread(target=refresh_subscription, kwargs={"force_renew": True}, daemon=True).start()
+        elif event == "subscriptionRemoved":
+            threading.Thread(target=refresh_subscription, kwargs={"recreate": True}, daemon=True).start()
+        elif event == "missed":
+            request_pipeline_run()  # notifications were lost → full delta sync
+    if message_ids:
+        print(f"🔔 {len(message_ids)} new emails notified")
+        request_pipeline_run(message_ids)
+    return Response(status_code=202)
+
+
+# run_step_two_all already fans SO folders out over a worker pool, so only one
+# pipeline run at a time. Work requested meanwhile (scheduler ticks, notified
+# emails) is queued and picked up by the running thread when its run finishes.
+_pipeline_running = threading.Lock()
+_pending_lock = threading.Lock()
+_pending_full_run = False
+_pending_messages = []  # email ids from Graph notifications, in arrival order
+
+def _take_pending():
+    global _pending_full_run
+    with _pending_lock:
+        full_run = _pending_full_run
+        email_ids = list(dict.fromkeys(_pending_messages))
+        _pending_full_run = False
+        _pending_messages.clear()
+    return full_run, email_ids
+
+def _queue_full_run():
+    global _pending_full_run
+    with _pending_lock:
+        _pending_full_run = True
+
+def _has_pending():
+    with _pending_lock:
+        return _pending_full_run or bool(_pending_messages)
+
+def _run_pipeline_once():
+    try:
+        while True:
+            full_run, email_ids = _take_pending()
+            if not full_run and not email_ids:
+                break
+            try:
+                if full_run:
+                    run_full_pipeline()  # the delta sync also covers any notified emails
+                else:
+                    run_full_pipeline(email_ids)
+            except Exception as e:
+                print(f"[❌ Pipeline] {e}")
+                if not full_run:
+                    # don't drop the notified emails: the delta sync picks them up again
+                    _queue_full_run()
+    finally:
+        _pipeline_running.release()
+    # work queued between the last check and the release
+    if _has_pending():
+        _start_pipeline()
+
+def _start_pipeline():
+    if not _pipeline_running.acquire(blocking=False):
+        print("⏭️ Pipeline run in progress — queued for when it finishes")
+        return
+    threading.Thread(target=_run_pipeline_once).start() # stay responsive and doecnt block requests
+
+def request_pipeline_run(email_ids=None):
+    if email_ids is None:
+        _queue_full_run()
+    else:
+        with _pending_lock:
+            _pending_messages.extend(email_ids)
+    _start_pipeline()
 
 def safe_run_pipeline():
-    threading.Thread(target=run_full_pipeline).start() # stay responsive and doecnt block requests
+    request_pipeline_run()
+
+def refresh_subscription(force_renew=False, recreate=False):
+    try:
+        ensure_subscription(build_config(), force_renew=force_renew, recreate=recreate)
+    except Exception as e:
+        print(f"[❌ Graph subscription] {e} — polling every {SAFETY_POLL_SECONDS}s still runs")
 
-# Scheduler
+# Scheduler: with push on, polling is only a safety net for missed notifications
 scheduler = BackgroundScheduler()
-scheduler.add_job(safe_run_pipeline, 'interval', seconds=30)
-scheduler.start()
 
+@app.on_event("startup")
+def start_scheduler():
+    scheduler.add_job(safe_run_pipeline, 'interval', seconds=SAFETY_POLL_SECONDS if push_enabled() else PIPELINE_POLL_SECONDS)
+    if push_enabled():
+        scheduler.add_job(refresh_subscription, 'interval', minutes=30)
+    scheduler.start()
+
+@app.on_event("shutdown")
+def stop_scheduler():
+    scheduler.shutdown(wait=False)
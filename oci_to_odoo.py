@@ -1,19 +1,19 @@
 import json
 import os
-from Preprocessing.ocr_service import oracle_extract_text_oci_object
-from config import CLIENT_ID, SCOPES, TENANT_ID
-from llm_services.llm_parser import extract_quotation_data
-from oci_utils import get_namespace, get_oci_client
+from Preprocessing.ocr_service import oracle_extract_text_batch, oracle_extract_text_oci_object
+from config import ENABLE_OCR_BATCH, OPENAI_MODEL, STEP_TWO_WORKERS
+from llm_services.llm_parser import PROMPT_VERSION, extract_quotation_data_many
+from oci_utils import copy_object_server_side, get_namespace, get_oci_client
 from odoo_services.quotation_pipeline import process_quotation_data
 from odoo_services.sales_order_service import get_sales_order
-from odoo_services.utils import get_odoo_connection
-from Preprocessing.doc_classifier import classify_file
-from Preprocessing.extractor import extract_text
+from odoo_services.utils import named_lock
+from Preprocessing.doc_classifier import IMAGE, IMAGE_EXTENSIONS, PDF_SCANNED, PDF_TEXT, analyze_document
 from collections import defaultdict
 import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import oci
-from odoo_to_outlook import get_email_json_by_id, reply_to_email
-from outlook_to_oci import get_outlook_token
+from odoo_to_outlook import flush_replies, has_pending_replies, queue_reply
+from outlook_to_oci import get_outlook_token, load_hash_index_entry, save_hash_index_entry
 
 def list_unprocessed_so_folders(bucket_name, config):
     client = get_oci_client(config)
@@ -26,7 +26,7 @@ def list_unprocessed_files(bucket_name, so_folder, config):
     namespace = get_namespace(client)
     prefix = f"attachments/unprocessed/{so_folder}/"
     files = client.list_objects(namespace, bucket_name, prefix=prefix).data.objects
-    return [f.name for f in files if f.name.endswith((".pdf", ".png", ".jpg"))]
+    return [f.name for f in files if f.name.lower().endswith((".pdf", *IMAGE_EXTENSIONS))]
 
 def download_file_from_oci(object_name, config, bucket_name):
     client = get_oci_client(config)
@@ -42,10 +42,33 @@ def move_attachment_to_processed(bucket_name, file_path, config):
     namespace = get_namespace(client)
     processed_path = file_path.replace("unprocessed/", "processed/")
     
-    # Copy then delete
-    obj = client.get_object(namespace, bucket_name, file_path)
-    client.put_object(namespace, bucket_name, processed_path, obj.data.content)
-    client.delete_object(namespace, bucket_name, file_path)
+    # Server-side rename: metadata only, no bytes leave Object Storage
+    try:
+        client.rename_object(namespace, bucket_name, oci.object_storage.models.RenameObjectDetails(
+            source_name=file_path,
+            new_name=processed_path,
+        ))
+    except oci.exceptions.ServiceError as e:
+        if e.status == 404:
+            raise
+        # fallback: server-side copy then delete
+        print(f"[⚠️ Rename failed] {file_path} ({e.status}) — copying server-side instead")
+        copy_object_server_side(config, bucket_name, file_path, processed_path)
+        client.delete_object(namespace, bucket_name, file_path)
+
+def move_attachments_to_processed(bucket_name, file_paths, config, max_workers=8):
+    # all files of an SO folder at once; each move is a single metadata call
+    if not file_paths:
+        return
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(file_paths))) as pool:
+        list(pool.map(lambda path: move_attachment_to_processed(bucket_name, path, config), file_paths))
+
+def get_object_content_hash(bucket_name, object_name, config):
+    # set by upload_attachment_to_oci; older uploads have none
+    client = get_oci_client(config)
+    namespace = get_namespace(client)
+    response = client.head_object(namespace, bucket_name, object_name)
+    return response.headers.get("opc-meta-content-sha256")
 
 # ---- Multi thread issue ------
 
@@ -87,123 +110,223 @@ def delete_file(bucket_name, object_name, oci_cfg):
         if e.status != 404:
             raise
 
-def run_step_two_all(config, classify_file, extract_text, extract_quotation_data, process_quotation_data, get_odoo_connection):
+# Odoo work already done for a folder whose push failed part-way (see process_quotation_data)
+PROGRESS_PREFIX = "attachments/progress/"
+
+def load_folder_progress(bucket_name, so_folder, oci_cfg):
+    client = get_oci_client(oci_cfg)
+    namespace = get_namespace(client)
+    try:
+        obj = client.get_object(namespace, bucket_name, f"{PROGRESS_PREFIX}{so_folder}.json")
+        return json.loads(obj.data.content.decode("utf-8"))
+    except oci.exceptions.ServiceError as e:
+        if e.status == 404:
+            return {}
+        else:
+            raise
+
+def save_folder_progress(bucket_name, so_folder, progress, oci_cfg):
+    client = get_oci_client(oci_cfg)
+    namespace = get_namespace(client)
+    client.put_object(namespace, bucket_name, f"{PROGRESS_PREFIX}{so_folder}.json", json.dumps(progress, indent=2).encode("utf-8"))
+
+def process_so_folder(so_folder, config, analyze_document, extract_quotation_data_many, process_quotation_data):
     bucket_name = config["oci"]["bucket_name"]
     oci_cfg = config["oci"]
-    ms = config["microsoft"]
-    so_folders = list_unprocessed_so_folders(bucket_name, oci_cfg)
 
-    print(f"📦 Found {len(so_folders)} SO folders: {so_folders}")
+    try:
+        so_number, email_id = so_folder.split("_", 1)
+    except ValueError:
+        print(f"[⚠️ Skipping] Invalid folder name: {so_folder}")
+        return "invalid"
 
-    models, db, uid, password = get_odoo_connection()
+    print(f"\n🔍 Processing SO Folder: {so_folder} (SO={so_number}, Email ID={email_id})")
 
-    for so_folder in so_folders:
+    # 🔒 Attempt to acquire lock atomically
+    lock_path = f"attachments/locks/{so_folder}.lock"
+    acquired = put_dummy_file(bucket_name, lock_path, oci_cfg)
+    if not acquired:
+        print(f"🔒 Skipping {so_folder} — already being processed")
+        return "locked"
 
-        try:
-                so_number, email_id = so_folder.split("_", 1)
-        except ValueError:
-            print(f"[⚠️ Skipping] Invalid folder name: {so_folder}")
-            continue
-
-        print(f"\n🔍 Processing SO Folder: {so_folder} (SO={so_number}, Email ID={email_id})")
-
-        # 🔒 Attempt to acquire lock atomically
-        lock_path = f"attachments/locks/{so_folder}.lock"
-        acquired = put_dummy_file(bucket_name, lock_path, oci_cfg)
-        if not acquired:
-            print(f"🔒 Skipping {so_folder} — already being processed")
-            continue
-  
-        try:
+    try:
+
+        # ✅ Skip SOs not found in Odoo
+        order_id = get_sales_order(so_number)
+        if not order_id:
+            print(f"[⚠️ WARNING] Sales Order {so_number} not found — skipping.")
+            return "missing_so"
 
-            # ✅ Skip SOs not found in Odoo
-            order_id = get_sales_order(so_number)
-            if not order_id:
-                print(f"[⚠️ WARNING] Sales Order {so_number} not found — skipping.")
+        all_files = list_unprocessed_files(bucket_name, so_folder, oci_cfg)
+        grouped_by_sin = defaultdict(list)
+
+        # ♻️ Byte-identical attachments parsed before skip download, OCR and LLM
+        hash_by_path = {}
+        structured_by_path = {}
+        for obj_path in all_files:
+            sha = get_object_content_hash(bucket_name, obj_path, oci_cfg)
+            if not sha:
                 continue
-            
-            all_files = list_unprocessed_files(bucket_name, so_folder, oci_cfg)
-            grouped_by_sin = defaultdict(list)
+            hash_by_path[obj_path] = sha
+            entry = load_hash_index_entry(bucket_name, oci_cfg, sha)
+            # extractions of an older prompt or another model are redone, as in the LLM cache
+            if (entry and entry.get("extraction")
+                    and entry.get("prompt_version") == PROMPT_VERSION and entry.get("model") == OPENAI_MODEL):
+                structured_by_path[obj_path] = entry["extraction"]
+                print(f"[♻️ Reused] {os.path.basename(obj_path)} — same content as {entry.get('first_object')}")
+
+        extracted_by_path = {}
+        scanned_paths = []
 
-            for obj_path in all_files:
-                filename = os.path.basename(obj_path)
+        for obj_path in all_files:
+            if obj_path in structured_by_path:
+                continue
+            filename = os.path.basename(obj_path)
+            if os.path.splitext(obj_path)[1].lower() in IMAGE_EXTENSIONS:
+                file_type = IMAGE  # uploaded as-is for OCR (IMAGE_DIRECT_OCR), no need to download
+            else:
                 local_file = download_file_from_oci(obj_path, oci_cfg, bucket_name)
-                file_type = classify_file(local_file)
-                
-                print(f"📄 {filename} → {file_type}")
-                
-                if file_type == ("PDF (text-based)"):
-                    extracted = extract_text(local_file)
-                    
-                elif file_type == ("PDF (scanned/image)"):
-                    # Skip local OCR; use Oracle directly on the object in OCI
-                    extracted = oracle_extract_text_oci_object(obj_path, oci_cfg) #download from object storage                    
-                else:
-                    print(f"[⚠️ Unsupported or error type] {filename} → {file_type}")
-                    continue          
-                structured_data = extract_quotation_data(extracted)
-                print(f"[✅ llm] {structured_data}")
-
-                if structured_data and "Items" in structured_data and "Vendor" in structured_data:
-                    grouped_by_sin[so_number].append(structured_data)
-                    print(f"[✅ Processed] {filename}")
-                else:
-                    print(f"[⚠️ Invalid structure] {filename}")
-
-
-            if not grouped_by_sin[so_number]:
-                print(f"🚫 No valid quotations for {so_number}. Skipping push.")
+                analysis = analyze_document(local_file)  # classify + extract in one pass
+                file_type = analysis["file_type"]
+
+            print(f"📄 {filename} → {file_type}")
+
+            if file_type == PDF_TEXT:
+                extracted_by_path[obj_path] = analysis["text"]
+
+            elif file_type in (PDF_SCANNED, IMAGE):
+                # Skip local OCR; use Oracle directly on the object in OCI
+                scanned_paths.append(obj_path)
+            else:
+                print(f"[⚠️ Unsupported or error type] {filename} → {file_type}")
                 continue
 
-            # Push to Odoo
-            payload = {
-                "SIN": so_number,
-                "quotations": grouped_by_sin[so_number]
-            }
-
-            print(f"🚀 Pushing {len(payload['quotations'])} to Odoo for {so_number}")
-            process_quotation_data(payload)
-            
-            
-            access_token = get_outlook_token(
-                client_id=ms["client_id"],
-                tenant_id=ms["tenant_id"],
-                scopes=ms["scopes"]
-            )
-            email_json = get_email_json_by_id(so_folder, oci_cfg)
-
-            sender_name = email_json["from_name"]
-            print(f"sender name {sender_name}")
-
-            num_of_attachment = len(all_files)
-            
-            reply_to_email(
-                sender_name,
-                num_of_attachment,
-                so_number,
-                original_message_id=email_json["id"],  
-                access_token=access_token,
-            )
-        
-            # ✅ After successful push, move all related files to "processed"
-            for obj_path in all_files:
-                move_attachment_to_processed(bucket_name, obj_path, oci_cfg)
-                print(f"[📂 Moved] {os.path.basename(obj_path)} to processed")
-                
-            # Save payload
-            result_path = f"emails/processed/{so_number}_grouped.json"
-            client = get_oci_client(oci_cfg)
-            namespace = get_namespace(client)
-            client.put_object(namespace, bucket_name, result_path, json.dumps(payload, indent=2).encode("utf-8"))
-            print(f"[💾 Saved] {result_path}")
-            
-        except Exception as e:
-            print(f"[❌ Failed] {e}")
-        finally:
-            # ✅ Always release lock even if there's an error
-            delete_file(bucket_name, lock_path, oci_cfg)
-            print(f"🔓 Lock released for {so_number}")
+        # All scanned files of this SO go to Document AI together
+        if scanned_paths and ENABLE_OCR_BATCH:
+            extracted_by_path.update(oracle_extract_text_batch(scanned_paths, oci_cfg))
+        else:
+            for obj_path in scanned_paths:
+                extracted_by_path[obj_path] = oracle_extract_text_oci_object(obj_path, oci_cfg)
+
+        # All documents of the folder go to the LLM concurrently
+        extracted_paths = [p for p in all_files if p in extracted_by_path]
+        structured_results = extract_quotation_data_many(extracted_by_path[p] for p in extracted_paths)
 
-    print("✅ Attachment pipeline complete.")
+        for obj_path, structured_data in zip(extracted_paths, structured_results):
+            print(f"[✅ llm] {structured_data}")
+            structured_by_path[obj_path] = structured_data
+            sha = hash_by_path.get(obj_path)
+            if sha and structured_data and "Items" in structured_data and "Vendor" in structured_data:
+                save_hash_index_entry(bucket_name, oci_cfg, sha, {
+                    "sha256": sha,
+                    "first_object": obj_path,
+                    "prompt_version": PROMPT_VERSION,
+                    "model": OPENAI_MODEL,
+                    "extraction": structured_data,
+                })
+
+        for obj_path in all_files:
+            if obj_path not in structured_by_path:
+                continue
+            filename = os.path.basename(obj_path)
+            structured_data = structured_by_path[obj_path]
+
+            if structured_data and "Items" in structured_data and "Vendor" in structured_data:
+                grouped_by_sin[so_number].append(structured_data)
+                print(f"[✅ Processed] {filename}")
+            else:
+                print(f"[⚠️ Invalid structure] {filename}")
+
+
+        if not grouped_by_sin[so_number]:
+            print(f"🚫 No valid quotations for {so_number}. Skipping push.")
+            return "no_quotations"
+
+        # Push to Odoo
+        payload = {
+            "SIN": so_number,
+            "quotations": grouped_by_sin[so_number]
+        }
+
+        print(f"🚀 Pushing {len(payload['quotations'])} to Odoo for {so_number}")
+        # folders of the same SO (one per email) must not race on get_or_create_pr
+        progress = load_folder_progress(bucket_name, so_folder, oci_cfg)
+        try:
+            with named_lock("sale.order", so_number):
+                process_quotation_data(payload, progress)
+        except Exception:
+            if progress:  # the retry picks up from here
+                save_folder_progress(bucket_name, so_folder, progress, oci_cfg)
+            raise
+
+
+        # customer reply is sent with the others at the end of the run
+        queue_reply(so_folder, so_number, len(all_files))
 
+        # ✅ After successful push, move all related files to "processed"
+        move_attachments_to_processed(bucket_name, all_files, oci_cfg)
+        print(f"[📂 Moved] {len(all_files)} files to processed")
 
+        # Save payload
+        result_path = f"emails/processed/{so_number}_grouped.json"
+        client = get_oci_client(oci_cfg)
+        namespace = get_namespace(client)
+        client.put_object(namespace, bucket_name, result_path, json.dumps(payload, indent=2).encode("utf-8"))
+        print(f"[💾 Saved] {result_path}")
+        delete_file(bucket_name, f"{PROGRESS_PREFIX}{so_folder}.json", oci_cfg)
+        return "processed"
+
+    except Exception as e:
+        print(f"[❌ Failed] {so_folder}: {e}")
+        return "failed"
+    finally:
+        # ✅ Always release lock even if there's an error
+        delete_file(bucket_name, lock_path, oci_cfg)
+        print(f"🔓 Lock released for {so_number}")
+
+
+def run_step_two_all(config, analyze_document, extract_quotation_data_many, process_quotation_data, max_workers=None):
+    bucket_name = config["oci"]["bucket_name"]
+    oci_cfg = config["oci"]
+    so_folders = list_unprocessed_so_folders(bucket_name, oci_cfg)
+
+    print(f"📦 Found {len(so_folders)} SO folders: {so_folders}")
+
+    max_workers = max_workers or STEP_TWO_WORKERS
+    summary = defaultdict(list)
+
+    # Each folder is isolated: its own OCI lock, its own error handling
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="so-folder") as pool:
+        futures = {
+            pool.submit(
+                process_so_folder, so_folder, config,
+                analyze_document, extract_quotation_data_many, process_quotation_data
+            ): so_folder
+            for so_folder in so_folders
+        }
+        for future in as_completed(futures):
+            so_folder = futures[future]
+            try:
+                status = future.result()
+            except Exception as e:  # lock release itself failed
+                print(f"[❌ Failed] {so_folder}: {e}")
+                status = "failed"
+            summary[status].append(so_folder)
+
+    # 📧 one $batch for every customer reply of this run
+    # (replies left over from an earlier run's network error go out here too)
+    if summary.get("processed") or has_pending_replies():
+        ms = config["microsoft"]
+        access_token = get_outlook_token(
+            client_id=ms["client_id"],
+            tenant_id=ms["tenant_id"],
+            scopes=ms["scopes"]
+        )
+        flush_replies(access_token, oci_cfg)
+
+    summary = {status: sorted(folders) for status, folders in summary.items()}
+    print(f"📊 Step two summary ({max_workers} workers): " + ", ".join(f"{k}={len(v)}" for k, v in sorted(summary.items())))
+    if summary.get("failed"):
+        print(f"[❌ Failed folders] {summary['failed']}")
+    print("✅ Attachment pipeline complete.")
+    return summary
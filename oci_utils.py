@@ -1,8 +1,78 @@
+import threading
+import time
 import oci
 
 # --- OCI Helpers ---
+# One ObjectStorageClient per OCI config for the whole process. The client keeps its
+# own HTTP session, so sharing it reuses connections instead of a new handshake per call.
+_registry_lock = threading.Lock()
+_clients = {}     # config key -> ObjectStorageClient
+_namespaces = {}  # id(client) -> namespace
+_stats = {"clients_created": 0, "namespace_calls": 0}
+
+def _config_key(config):
+    return (
+        config.get("user"),
+        config.get("tenancy"),
+        config.get("fingerprint"),
+        config.get("region"),
+        config.get("key_file"),
+    )
+
 def get_oci_client(config):
-    return oci.object_storage.ObjectStorageClient(config)
+    key = _config_key(config)
+    with _registry_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = oci.object_storage.ObjectStorageClient(config)
+            _clients[key] = client
+            _stats["clients_created"] += 1
+            # namespace from .env saves the round-trip entirely
+            if config.get("namespace"):
+                _namespaces[id(client)] = config["namespace"]
+    return client
 
 def get_namespace(client):
-    return client.get_namespace().data
+    namespace = _namespaces.get(id(client))
+    if namespace:
+        return namespace
+    with _registry_lock:
+        namespace = _namespaces.get(id(client))
+        if namespace is None:
+            namespace = client.get_namespace().data
+            _namespaces[id(client)] = namespace
+            _stats["namespace_calls"] += 1
+    return namespace
+
+def copy_object_server_side(config, bucket_name, source_name, destination_name, wait=True, timeout=300):
+    # Object Storage copies the bytes itself; metadata (opc-meta-*) is carried over
+    client = get_oci_client(config)
+    namespace = get_namespace(client)
+    details = oci.object_storage.models.CopyObjectDetails(
+        source_object_name=source_name,
+        destination_region=config["region"],
+        destination_namespace=namespace,
+        destination_bucket=bucket_name,
+        destination_object_name=destination_name,
+    )
+    response = client.copy_object(namespace, bucket_name, details)
+    if not wait:
+        return response.headers.get("opc-work-request-id")
+
+    work_request_id = response.headers["opc-work-request-id"]
+    deadline = time.time() + timeout
+    delay = 0.2
+    while True:
+        status = client.get_work_request(work_request_id).data.status
+        if status == "COMPLETED":
+            return work_request_id
+        if status in ("FAILED", "CANCELED"):
+            raise Exception(f"Copy {source_name} → {destination_name} {status.lower()}")
+        if time.time() > deadline:
+            raise Exception(f"Copy {source_name} → {destination_name} still {status} after {timeout}s")
+        time.sleep(delay)
+        delay = min(delay * 2, 5)
+
+def get_oci_stats():
+    with _registry_lock:
+        return dict(_stats)
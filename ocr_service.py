@@ -1,7 +1,34 @@
-from time import sleep
+import json
+from time import sleep, time
+import oci
 from oci.ai_document import AIServiceDocumentClient
-from oci.ai_document.models import AnalyzeDocumentDetails, ObjectStorageDocumentDetails, DocumentTextExtractionFeature
+from oci.ai_document.models import (
+    AnalyzeDocumentDetails,
+    CreateProcessorJobDetails,
+    DocumentTextExtractionFeature,
+    GeneralProcessorConfig,
+    ObjectLocation,
+    ObjectStorageDocumentDetails,
+    ObjectStorageLocations,
+    OutputLocation,
+)
 from oci.exceptions import ServiceError
+from config import OCR_BATCH_TIMEOUT
+from oci_utils import get_namespace, get_oci_client
+
+OCR_RESULTS_PREFIX = "ocr_results"
+
+
+def _lines_to_text(pages):
+    # pages: list of dicts (job output JSON) or SDK page models (analyze_document)
+    lines = []
+    for page in (pages or []):
+        page_lines = page.get("lines") if isinstance(page, dict) else page.lines
+        for ln in (page_lines or []):
+            text = ln.get("text") if isinstance(ln, dict) else ln.text
+            if text:
+                lines.append(text)
+    return "\n".join(lines).strip()
 
 
 def oracle_extract_text_oci_object(obj_path, oci_cfg, retries=2):
@@ -13,24 +40,18 @@ def oracle_extract_text_oci_object(obj_path, oci_cfg, retries=2):
         namespace_name=oci_cfg["namespace"],
         bucket_name=oci_cfg["bucket_name"],
         object_name=obj_path
-    )    
+    )
     details = AnalyzeDocumentDetails(
         document=document,
         features=[DocumentTextExtractionFeature()],
         document_type="OTHERS",
         compartment_id=oci_cfg["compartment_id"]
     )
-    response = client.analyze_document(analyze_document_details=details)
 
     for attempt in range(retries + 1):
         try:
             response = client.analyze_document(analyze_document_details=details)
-            lines = []
-            for page in (response.data.pages or []):
-                for ln in (page.lines or []):
-                    if ln.text:
-                        lines.append(ln.text)
-            final_text = "\n".join(lines).strip()
+            final_text = _lines_to_text(response.data.pages)
             print(f"\n📝 Reconstructed OCR Text: {final_text}")
             return final_text
         except ServiceError as e:
@@ -39,3 +60,98 @@ def oracle_extract_text_oci_object(obj_path, oci_cfg, retries=2):
                 sleep(1.0 * (attempt + 1))
                 continue
             raise
+
+
+def oracle_extract_text_batch(obj_paths, oci_cfg, poll_interval=5, timeout=OCR_BATCH_TIMEOUT):
+    """
+    OCRs many objects with one asynchronous Document AI processor job.
+    Returns {obj_path: text}; objects missing from the job output are retried
+    one by one with oracle_extract_text_oci_object.
+    """
+    obj_paths = list(dict.fromkeys(obj_paths))
+    if not obj_paths:
+        return {}
+    if len(obj_paths) == 1:
+        return {obj_paths[0]: oracle_extract_text_oci_object(obj_paths[0], oci_cfg)}
+
+    bucket_name = oci_cfg["bucket_name"]
+    storage = get_oci_client(oci_cfg)
+    namespace = get_namespace(storage)
+    client = AIServiceDocumentClient(oci_cfg)
+
+    details = CreateProcessorJobDetails(
+        input_location=ObjectStorageLocations(
+            source_type="OBJECT_STORAGE_LOCATIONS",
+            object_locations=[
+                ObjectLocation(namespace_name=namespace, bucket_name=bucket_name, object_name=p)
+                for p in obj_paths
+            ],
+        ),
+        output_location=OutputLocation(
+            namespace_name=namespace,
+            bucket_name=bucket_name,
+            prefix=OCR_RESULTS_PREFIX,
+        ),
+        processor_config=GeneralProcessorConfig(
+            processor_type="GENERAL",
+            features=[DocumentTextExtractionFeature()],
+            document_type="OTHERS",
+        ),
+        compartment_id=oci_cfg["compartment_id"],
+    )
+    try:
+        job = client.create_processor_job(create_processor_job_details=details).data
+    except ServiceError as e:
+        # e.g. no IAM policy for processor jobs: per-file OCR still works
+        print(f"[⚠️ OCR job not submitted] {e.status} {e.message} — running single-document OCR")
+        return {obj_path: oracle_extract_text_oci_object(obj_path, oci_cfg) for obj_path in obj_paths}
+    print(f"🧾 OCR job {job.id} submitted for {len(obj_paths)} documents")
+
+    try:
+        deadline = time() + timeout
+        state = job.lifecycle_state
+        try:
+            while state in ("ACCEPTED", "IN_PROGRESS") and time() < deadline:
+                sleep(poll_interval)
+                state = client.get_processor_job(job.id).data.lifecycle_state
+        except ServiceError as e:
+            print(f"[⚠️ OCR job polling failed] {job.id}: {e.status} {e.message}")
+
+        if state in ("ACCEPTED", "IN_PROGRESS"):
+            print(f"[⚠️ OCR job unfinished] {job.id} still {state} — cancelling")
+            try:
+                client.cancel_processor_job(job.id)
+            except ServiceError:
+                pass
+        elif state != "SUCCEEDED":
+            print(f"[⚠️ OCR job {state}] {job.id} — falling back to per-file OCR")
+
+        # Job output layout: <prefix>/<job id>/<namespace>_<bucket>/results/<object name>.json
+        results = {}
+        for obj_path in obj_paths:
+            result_name = f"{OCR_RESULTS_PREFIX}/{job.id}/{namespace}_{bucket_name}/results/{obj_path}.json"
+            try:
+                obj = storage.get_object(namespace, bucket_name, result_name)
+                results[obj_path] = _lines_to_text(json.loads(obj.data.content).get("pages"))
+            except ServiceError as e:
+                if e.status != 404:
+                    raise
+                print(f"[⚠️ No OCR job result] {obj_path} — running single-document OCR")
+                results[obj_path] = oracle_extract_text_oci_object(obj_path, oci_cfg)
+    finally:
+        _delete_job_output(storage, namespace, bucket_name, job.id)
+
+    print(f"📝 OCR job {job.id} returned text for {len(results)} documents")
+    return results
+
+def _delete_job_output(storage, namespace, bucket_name, job_id):
+    # the text is in hand; the job's JSON output would otherwise pile up in the bucket
+    try:
+        objects = oci.pagination.list_call_get_all_results(
+            storage.list_objects, namespace, bucket_name,
+            prefix=f"{OCR_RESULTS_PREFIX}/{job_id}/", fields="name"
+        ).data.objects
+        for o in objects:
+            storage.delete_object(namespace, bucket_name, o.name)
+    except ServiceError as e:
+        print(f"[⚠️ OCR output cleanup failed] {job_id}: {e.status}")
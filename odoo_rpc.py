@@ -0,0 +1,87 @@
+import itertools
+import threading
+import xmlrpc.client
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import ODOO_POOL_SIZE, ODOO_RPC_PROTOCOL, ODOO_TIMEOUT, ODOO_URL
+
+
+class OdooRPCError(Exception):
+    pass
+
+
+# One requests.Session for all Odoo traffic: keep-alive connections, pooled and
+# safe to share between the step-two and RFQ worker threads.
+_session = None
+_session_lock = threading.Lock()
+
+def get_http_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=ODOO_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+    return _session
+
+
+class OdooRPCProxy:
+    """
+    Drop-in for xmlrpc.client.ServerProxy: proxy.<method>(*args) calls <method> on an
+    Odoo service ("common" or "object"), so models.execute_kw(db, uid, password, ...)
+    keeps working. protocol is "jsonrpc" (/jsonrpc) or "xmlrpc" (/xmlrpc/2/<service>).
+    """
+    _ids = itertools.count(1)
+
+    def __init__(self, service, url=ODOO_URL, protocol=ODOO_RPC_PROTOCOL, timeout=ODOO_TIMEOUT):
+        if protocol not in ("jsonrpc", "xmlrpc"):
+            raise ValueError(f"Unknown Odoo RPC protocol: {protocol}")
+        self.service = service
+        self.url = url.rstrip("/")
+        self.protocol = protocol
+        self.timeout = timeout
+
+    def __getattr__(self, method):
+        if method.startswith("_"):
+            raise AttributeError(method)
+
+        def _call(*args):
+            if self.protocol == "jsonrpc":
+                return self._call_jsonrpc(method, args)
+            return self._call_xmlrpc(method, args)
+        return _call
+
+    def _call_jsonrpc(self, method, args):
+        payload = {
+            "jsonrpc": "2.0",
+            "method": "call",
+            "params": {"service": self.service, "method": method, "args": list(args)},
+            "id": next(self._ids),
+        }
+        response = get_http_session().post(f"{self.url}/jsonrpc", json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        body = response.json()
+        if body.get("error"):
+            error = body["error"]
+            message = (error.get("data") or {}).get("message") or error.get("message")
+            raise OdooRPCError(f"Odoo {self.service}.{method} failed: {message}")
+        return body.get("result")
+
+    def _call_xmlrpc(self, method, args):
+        request_body = xmlrpc.client.dumps(tuple(args), method).encode("utf-8")
+        response = get_http_session().post(
+            f"{self.url}/xmlrpc/2/{self.service}",
+            data=request_body,
+            headers={"Content-Type": "text/xml"},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        try:
+            result, _ = xmlrpc.client.loads(response.content, use_builtin_types=True)
+        except xmlrpc.client.Fault as e:
+            raise OdooRPCError(f"Odoo {self.service}.{method} failed: {e.faultString}") from e
+        return result[0]
@@ -1,6 +1,7 @@
 import json
 from oci_utils import get_namespace, get_oci_client
-import requests
+import threading
+from graph_client import graph_batch
 
 def get_email_json_by_id(email_id, oci_cfg):
     client = get_oci_client(oci_cfg)
@@ -15,14 +16,14 @@ def get_email_json_by_id(email_id, oci_cfg):
         print(f"[⚠️ Could not fetch email JSON] {email_id}: {e}")
         return None
 
-def reply_to_email(sender_name, num_of_attachment, so_number, original_message_id, access_token):
+def build_reply_body(sender_name, num_of_attachment, so_number):
     
     first_name = sender_name.split()[0] if sender_name else "Valued Customer"
         
     attachment_info = "quotation has" if num_of_attachment == 1 else f"{num_of_attachment} quotations have"
 
     # 📨 Clean HTML body
-    reply_body = f"""
+    return f"""
     <p>Dear <strong>{first_name}</strong>,</p>
 
     <p>Thank you for your submission.</p>
@@ -34,39 +35,68 @@ def reply_to_email(sender_name, num_of_attachment, so_number, original_message_i
     <p>Best regards,<br>Sales Bot</p>
     """
 
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
+# === QUEUED REPLIES ===
+# Step two queues a reply per finished SO; flush_replies sends them together via $batch
+_pending_replies = []
+_pending_lock = threading.Lock()
 
-    # Step 1: Create the reply draft
-    create_reply_url = f"https://graph.microsoft.com/v1.0/me/messages/{original_message_id}/createReply"
-    response = requests.post(create_reply_url, headers=headers)
+def queue_reply(so_folder, so_number, num_of_attachment):
+    with _pending_lock:
+        _pending_replies.append({"so_folder": so_folder, "so_number": so_number, "num_of_attachment": num_of_attachment})
 
-    if response.status_code != 201:
-        print(f"[❌ Failed to create reply] {response.status_code} — {response.text}")
-        return
+def has_pending_replies():
+    with _pending_lock:
+        return bool(_pending_replies)
 
-    draft = response.json()
-    draft_id = draft["id"]
+def _requeue(replies):
+    # front of the queue, so they go out first next time
+    with _pending_lock:
+        _pending_replies[:0] = replies
 
-    # Step 2: Update the reply body
-    update_url = f"https://graph.microsoft.com/v1.0/me/messages/{draft_id}"
-    update_body = {
-        "body": {
-            "contentType": "HTML",  
-            "content": reply_body
-        }
-    }
-    update_resp = requests.patch(update_url, headers=headers, json=update_body)
-    if update_resp.status_code != 200:
-        print(f"[❌ Failed to update reply] {update_resp.status_code} — {update_resp.text}")
-        return
+def flush_replies(access_token, oci_cfg):
+    """
+    Sends every queued reply in $batch calls. Replies that could not be sent at
+    all (network error, email JSON unreadable) go back on the queue for the next
+    flush. Returns {so_folder: sent}.
+    """
+    with _pending_lock:
+        pending = list(_pending_replies)
+        _pending_replies.clear()
+    if not pending:
+        return {}
+
+    try:
+        requests_by_id = {}
+        for i, reply in enumerate(pending):
+            email_json = get_email_json_by_id(reply["so_folder"], oci_cfg)
+            if not email_json:
+                continue
+            requests_by_id[str(i)] = {
+                "id": str(i),
+                "method": "POST",
+                "url": f"/me/messages/{email_json['id']}/reply",
+                "headers": {"Content-Type": "application/json"},
+                "body": {"comment": build_reply_body(email_json.get("from_name"), reply["num_of_attachment"], reply["so_number"])},
+            }
+
+        headers = {"Authorization": f"Bearer {access_token}"}
+        responses = graph_batch(list(requests_by_id.values()), headers)
+    except Exception:
+        _requeue(pending)
+        raise
 
-    # Step 3: Send the reply
-    send_url = f"https://graph.microsoft.com/v1.0/me/messages/{draft_id}/send"
-    send_resp = requests.post(send_url, headers=headers)
-    if send_resp.status_code == 202:
-        print(f"[📧 Sent] Reply to original email {original_message_id}")
-    else:
-        print(f"[❌ Failed to send reply] {send_resp.status_code} — {send_resp.text}")
+    sent = {}
+    unsent = []
+    for request_id, item in responses.items():
+        reply = pending[int(request_id)]
+        sent[reply["so_folder"]] = item.get("status") == 202
+        if sent[reply["so_folder"]]:
+            print(f"[📧 Sent] Reply for {reply['so_folder']}")
+        elif item.get("status") == 0:
+            print(f"[⏳ Reply not sent, queued again] {reply['so_folder']} — {item.get('body')}")
+            unsent.append(reply)
+        else:
+            print(f"[❌ Failed to send reply] {reply['so_folder']} {item.get('status')} — {item.get('body')}")
+    if unsent:
+        _requeue(unsent)
+    return sent
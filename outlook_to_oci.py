@@ -1,13 +1,41 @@
 import json
-import requests
 import base64
 import hashlib
 import oci
 import os
 from msal import PublicClientApplication, SerializableTokenCache
-from tempfile import NamedTemporaryFile
-from PIL import Image
-from oci_utils import get_namespace, get_oci_client
+import io
+import multiprocessing
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageSequence
+
+try:  # optional: HEIC/HEIF support
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+    HEIF_EXTENSIONS = [".heic", ".heif"]
+except ImportError:
+    HEIF_EXTENSIONS = []  # Pillow cannot open them: uploaded as-is
+from config import (
+    EMAIL_MAX_ATTEMPTS,
+    FETCH_ONLY_WITH_ATTACHMENTS,
+    GRAPH_BATCH_MAX_BYTES,
+    GRAPH_PAGE_SIZE,
+    IMAGE_DIRECT_OCR,
+    IMAGE_POOL_MIN_BYTES,
+    IMAGE_WORKERS,
+    LARGE_ATTACHMENT_BYTES,
+    STREAM_PART_SIZE,
+    STREAM_UPLOAD_PARALLEL,
+    TOKEN_CACHE_PATH,
+    TOKEN_REFRESH_MARGIN,
+)
+from oci.object_storage import UploadManager
+from graph_client import GRAPH_BATCH_LIMIT, graph_batch, graph_get
+from oci_utils import copy_object_server_side, get_namespace, get_oci_client
+from Preprocessing.doc_classifier import IMAGE_EXTENSIONS
 
 # def get_outlook_token(client_id, tenant_id, scopes):
 #     authority = f"https://login.microsoftonline.com/{tenant_id}"
@@ -16,67 +44,185 @@ from oci_utils import get_namespace, get_oci_client
 #     return result['access_token']
 
 # === AUTH ===
-def get_outlook_token(client_id, tenant_id, scopes, cache_path="token_cache.json"):
-    authority = f"https://login.microsoftonline.com/{tenant_id}"
-
-    # Load token cache from file if exists
-    cache = SerializableTokenCache()
-    if os.path.exists(cache_path):
-        cache.deserialize(open(cache_path, "r").read())
-
-    app = PublicClientApplication(client_id, authority=authority, token_cache=cache)
-
-    # Try to acquire token silently
-    accounts = app.get_accounts()
-    if accounts:
-        result = app.acquire_token_silent(scopes, account=accounts[0])
-        if result:
-            return result['access_token']
+# One token provider per (client, tenant, scopes) for the whole process: the access
+# token stays in memory until TOKEN_REFRESH_MARGIN seconds before it expires, and
+# only one thread talks to MSAL or writes token_cache.json at a time.
+class OutlookTokenProvider:
+    def __init__(self, client_id, tenant_id, scopes, cache_path=TOKEN_CACHE_PATH):
+        self.scopes = list(scopes)
+        self.cache_path = cache_path
+        self._lock = threading.Lock()
+        self._access_token = None
+        self._expires_at = 0.0
+
+        self._cache = SerializableTokenCache()
+        if os.path.exists(cache_path):
+            with open(cache_path, "r") as f:
+                self._cache.deserialize(f.read())
+        authority = f"https://login.microsoftonline.com/{tenant_id}"
+        self._app = PublicClientApplication(client_id, authority=authority, token_cache=self._cache)
+
+    def _is_fresh(self):
+        return self._access_token and time.time() < self._expires_at - TOKEN_REFRESH_MARGIN
+
+    def get_token(self):
+        if self._is_fresh():
+            return self._access_token
+        with self._lock:
+            # another thread may have refreshed while we waited
+            if self._is_fresh():
+                return self._access_token
+            result = self._acquire()
+            if "access_token" not in result:
+                raise Exception(f"Failed to acquire token: {result}")
+            self._access_token = result["access_token"]
+            self._expires_at = time.time() + int(result.get("expires_in", 0))
+            self._persist_cache()
+            return self._access_token
+
+    def invalidate(self, stale_token=None):
+        # e.g. after a 401: the next get_token() goes back to MSAL.
+        # With stale_token, only drop it if no other thread has replaced it yet.
+        with self._lock:
+            if stale_token is not None and self._access_token != stale_token:
+                return False
+            self._access_token = None
+            self._expires_at = 0.0
+            return True
+
+    def _acquire(self):
+        # Try to acquire token silently (uses the refresh token when the cached one is stale)
+        accounts = self._app.get_accounts()
+        if accounts:
+            result = self._app.acquire_token_silent(self.scopes, account=accounts[0])
+            if result:
+                return result
+
+        # Fallback to device code flow
+        flow = self._app.initiate_device_flow(scopes=self.scopes)
+        if 'user_code' not in flow:
+            raise Exception("Device flow initiation failed")
+
+        print(f"\n🔑 To sign in, use a web browser to open:\n{flow['verification_uri']}")
+        print(f"And enter the code: {flow['user_code']}\n")
+        return self._app.acquire_token_by_device_flow(flow)
+
+    def _persist_cache(self):
+        if not self._cache.has_state_changed:
+            return
+        # temp file + rename, so a crash never leaves a half-written cache behind
+        directory = os.path.dirname(os.path.abspath(self.cache_path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".token_cache.", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(self._cache.serialize())
+            os.replace(tmp_path, self.cache_path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+        self._cache.has_state_changed = False
+
+_token_providers = {}
+_token_providers_lock = threading.Lock()
+
+def get_token_provider(client_id, tenant_id, scopes, cache_path=TOKEN_CACHE_PATH):
+    key = (client_id, tenant_id, tuple(scopes), cache_path)
+    with _token_providers_lock:
+        provider = _token_providers.get(key)
+        if provider is None:
+            provider = OutlookTokenProvider(client_id, tenant_id, scopes, cache_path)
+            _token_providers[key] = provider
+    return provider
+
+def get_outlook_token(client_id, tenant_id, scopes, cache_path=TOKEN_CACHE_PATH):
+    return get_token_provider(client_id, tenant_id, scopes, cache_path).get_token()
+
+def refresh_outlook_token(stale_token):
+    # graph_client calls this on a 401; returns a new token from whichever provider issued the stale one
+    with _token_providers_lock:
+        providers = list(_token_providers.values())
+    for provider in providers:
+        if provider.invalidate(stale_token):
+            return provider.get_token()
+    return None
 
-    # Fallback to device code flow
-    flow = app.initiate_device_flow(scopes=scopes)
-    if 'user_code' not in flow:
-        raise Exception("Device flow initiation failed")
+# === METADATA TRACKING ===
+# def generate_email_uid(email_id):
+#     return hashlib.sha256(email_id.encode()).hexdigest()[:12]
 
-    print(f"\n🔑 To sign in, use a web browser to open:\n{flow['verification_uri']}")
-    print(f"And enter the code: {flow['user_code']}\n")
+# Inbox sync state is one Graph delta link, whatever the mailbox size
+DELTA_LINK_OBJECT = "metadata/inbox_delta_link.txt"
 
-    result = app.acquire_token_by_device_flow(flow)
+def load_delta_link(bucket_name, config):
+    client = get_oci_client(config)
+    namespace = get_namespace(client)
+    try:
+        obj = client.get_object(namespace, bucket_name, DELTA_LINK_OBJECT)
+        return obj.data.content.decode("utf-8").strip() or None
+    except oci.exceptions.ServiceError as e:
+        if e.status == 404:
+            return None
+        else:
+            raise
 
-    # Save updated cache
-    if cache.has_state_changed:
-        with open(cache_path, "w") as f:
-            f.write(cache.serialize())
+def save_delta_link(bucket_name, config, delta_link):
+    client = get_oci_client(config)
+    namespace = get_namespace(client)
+    client.put_object(namespace, bucket_name, DELTA_LINK_OBJECT, delta_link.encode("utf-8"))
 
-    if "access_token" in result:
-        return result["access_token"]
-    else:
-        raise Exception(f"Failed to acquire token: {result}")
+def email_already_ingested(bucket_name, config, so_number, email_id):
+    # delta also reports changed messages (read flag, moves); skip what step one already stored
+    client = get_oci_client(config)
+    namespace = get_namespace(client)
+    try:
+        client.head_object(namespace, bucket_name, f"emails/raw/{so_number}_{email_id}.json")
+        return True
+    except oci.exceptions.ServiceError as e:
+        if e.status == 404:
+            return False
+        else:
+            raise
 
-# === METADATA TRACKING ===
-# def generate_email_uid(email_id):
-#     return hashlib.sha256(email_id.encode()).hexdigest()[:12]
+# Emails whose attachments failed to ingest: attempts are counted per email, and
+# after EMAIL_MAX_ATTEMPTS the email is dead-lettered (kept here, skipped by step one)
+FAILED_EMAILS_PREFIX = "metadata/failed_emails/"
 
-def get_processed_ids(bucket_name, config):
+def load_email_failure(bucket_name, config, so_number, email_id):
     client = get_oci_client(config)
     namespace = get_namespace(client)
-    object_name = "metadata/processed_emails.json"
     try:
-        obj = client.get_object(namespace, bucket_name, object_name)
-        content = obj.data.content.decode("utf-8")
-        return set(json.loads(content).get("ids", []))
+        obj = client.get_object(namespace, bucket_name, f"{FAILED_EMAILS_PREFIX}{so_number}_{email_id}.json")
+        return json.loads(obj.data.content.decode("utf-8"))
     except oci.exceptions.ServiceError as e:
         if e.status == 404:
-            return set()
+            return None
         else:
             raise
 
-def save_processed_ids(bucket_name, config, processed_ids):
+def record_email_failure(bucket_name, config, email, so_number, error):
+    entry = load_email_failure(bucket_name, config, so_number, email["id"]) or {
+        "email_id": email["id"],
+        "so_number": so_number,
+        "subject": email.get("subject"),
+        "attempts": 0,
+    }
+    entry["attempts"] += 1
+    entry["last_error"] = str(error)
+    entry["dead_lettered"] = entry["attempts"] >= EMAIL_MAX_ATTEMPTS
     client = get_oci_client(config)
     namespace = get_namespace(client)
-    object_name = "metadata/processed_emails.json"
-    content = json.dumps({"ids": list(processed_ids)}, indent=2)
-    client.put_object(namespace, bucket_name, object_name, content.encode("utf-8"))
+    client.put_object(namespace, bucket_name, f"{FAILED_EMAILS_PREFIX}{so_number}_{email['id']}.json",
+                      json.dumps(entry, indent=2).encode("utf-8"))
+    return entry
+
+def clear_email_failure(bucket_name, config, so_number, email_id):
+    client = get_oci_client(config)
+    namespace = get_namespace(client)
+    try:
+        client.delete_object(namespace, bucket_name, f"{FAILED_EMAILS_PREFIX}{so_number}_{email_id}.json")
+    except oci.exceptions.ServiceError as e:
+        if e.status != 404:
+            raise
 
 def load_last_processed_time(bucket_name, config):
     client = get_oci_client(config)
@@ -98,71 +244,287 @@ def save_last_processed_time(bucket_name, config, latest_timestamp):
     client.put_object(namespace, bucket_name, object_name, latest_timestamp.encode("utf-8"))
 
 # === EMAIL FETCHING ===
-def fetch_emails(access_token, since_iso_datetime=None):
-    headers = {'Authorization': f'Bearer {access_token}'}
-    url = "https://graph.microsoft.com/v1.0/me/mailFolders/inbox/messages?$top=50"
-    if since_iso_datetime:
-        url += f"&$filter=receivedDateTime ge {since_iso_datetime}"
-    response = requests.get(url, headers=headers)
-    if response.status_code != 200:
-        raise Exception(f"Failed to fetch emails: {response.text}")
-    return response.json().get("value", [])
+# only what upload_email_metadata and run_step_one read
+EMAIL_SELECT_FIELDS = "id,subject,from,receivedDateTime,bodyPreview,hasAttachments"
+
+def iter_inbox_delta(access_token, sync_state, since_iso_datetime=None, page_size=None):
+    """
+    Yields inbox messages added or changed since the last poll (Graph delta query).
+    sync_state["delta_link"] is read as the starting point and replaced with the new
+    delta link once the last page has been consumed. Without a delta link (first run,
+    or Graph expired it) the sync restarts from since_iso_datetime.
+    """
+    page_size = page_size or GRAPH_PAGE_SIZE
+    headers = {
+        'Authorization': f'Bearer {access_token}',
+        'Prefer': f'odata.maxpagesize={page_size}',
+    }
 
-def fetch_attachments(email_id, headers):
-    url = f"https://graph.microsoft.com/v1.0/me/messages/{email_id}/attachments"
-    response = requests.get(url, headers=headers)
+    def _initial_request():
+        params = {"$select": EMAIL_SELECT_FIELDS}
+        if since_iso_datetime:
+            params["$filter"] = f"receivedDateTime ge {since_iso_datetime}"
+        return "https://graph.microsoft.com/v1.0/me/mailFolders/inbox/messages/delta", params
+
+    if sync_state.get("delta_link"):
+        url, params = sync_state["delta_link"], None
+    else:
+        url, params = _initial_request()
+
+    while url:
+        response = graph_get(url, headers=headers, params=params)
+        if response.status_code == 410 and sync_state.get("delta_link"):
+            # sync state expired on Graph's side → full resync from the last timestamp
+            print("[⚠️ Delta link expired] Restarting inbox sync")
+            sync_state["delta_link"] = None
+            url, params = _initial_request()
+            continue
+        if response.status_code != 200:
+            raise Exception(f"Failed to sync emails: {response.text}")
+        page = response.json()
+        for message in page.get("value", []):
+            if "@removed" not in message:
+                yield message
+        url = page.get("@odata.nextLink")
+        params = None
+        if not url and page.get("@odata.deltaLink"):
+            sync_state["delta_link"] = page["@odata.deltaLink"]
+
+def fetch_attachments_batch(email_ids, headers):
+    """
+    Attachments of many messages through Graph $batch: one round of size listings,
+    then one round for the content. Large attachments come back without
+    contentBytes and are streamed from /$value on upload. Returns {email_id: [attachments]};
+    a message with any failed listing or content request gets None and is reported.
+    """
+    email_ids = list(email_ids)
+    results = {email_id: [] for email_id in email_ids}
+    if not email_ids:
+        return results
+
+    listings = graph_batch([
+        {"id": str(i), "method": "GET", "url": f"/me/messages/{email_id}/attachments?$select=id,name,size,contentType"}
+        for i, email_id in enumerate(email_ids)
+    ], headers)
+
+    # second round: whole attachment list per message, or one request per small attachment
+    content_requests = []  # (email_id, attachment id or None, url, listed size)
+    for i, email_id in enumerate(email_ids):
+        item = listings.get(str(i), {})
+        if item.get("status") != 200:
+            print(f"Failed to fetch attachments for {email_id}: {item.get('body')}")
+            results[email_id] = None
+            continue
+        listing = (item.get("body") or {}).get("value", [])
+        if not any(is_large_attachment(a) for a in listing):
+            total = sum(a.get("size") or 0 for a in listing)
+            content_requests.append((email_id, None, f"/me/messages/{email_id}/attachments", total))
+            continue
+        for a in listing:
+            if is_large_attachment(a):
+                results[email_id].append(a)  # no contentBytes → streamed from /$value on upload
+            else:
+                content_requests.append((email_id, a["id"], f"/me/messages/{email_id}/attachments/{a['id']}", a.get("size") or 0))
+
+    # keep each $batch response (base64 inflates ~4/3) within GRAPH_BATCH_MAX_BYTES
+    groups, group, group_bytes = [], [], 0
+    for req in content_requests:
+        if group and (len(group) == GRAPH_BATCH_LIMIT or group_bytes + req[3] > GRAPH_BATCH_MAX_BYTES):
+            groups.append(group)
+            group, group_bytes = [], 0
+        group.append(req)
+        group_bytes += req[3]
+    if group:
+        groups.append(group)
+
+    for group in groups:
+        responses = graph_batch([
+            {"id": str(i), "method": "GET", "url": url} for i, (_, _, url, _) in enumerate(group)
+        ], headers)
+        for i, (email_id, attachment_id, _, _) in enumerate(group):
+            item = responses.get(str(i), {})
+            if item.get("status") != 200:
+                print(f"Failed to fetch attachment {attachment_id or '(all)'} for {email_id}: {item.get('body')}")
+                results[email_id] = None
+                continue
+            body = item.get("body") or {}
+            if results[email_id] is None:
+                continue
+            if attachment_id is None:
+                results[email_id].extend(body.get("value", []))
+            else:
+                results[email_id].append(body)
+
+    return results
+
+def is_large_attachment(attachment):
+    return (attachment.get("size") or 0) > LARGE_ATTACHMENT_BYTES
+
+def attachment_value_url(email_id, attachment):
+    return f"https://graph.microsoft.com/v1.0/me/messages/{email_id}/attachments/{attachment['id']}/$value"
+
+def download_attachment_bytes(email_id, attachment, headers):
+    response = graph_get(attachment_value_url(email_id, attachment), headers=headers)
     if response.status_code != 200:
-        print(f"Failed to fetch attachments for {email_id}: {response.text}")
-        return []
-    return response.json().get("value", [])
+        raise Exception(f"Failed to download attachment {attachment.get('name')}: {response.text}")
+    return response.content
+
+def stream_attachment_to_oci(email_id, attachment, object_name, bucket_name, config, headers):
+    # Graph /$value → OCI multipart upload; memory stays at about part_size × parallel parts
+    client = get_oci_client(config)
+    namespace = get_namespace(client)
+    with graph_get(attachment_value_url(email_id, attachment), headers=headers, stream=True) as response:
+        if response.status_code != 200:
+            raise Exception(f"Failed to stream attachment {attachment.get('name')}: {response.text}")
+        response.raw.decode_content = True
+        upload_manager = UploadManager(client, allow_parallel_uploads=True, parallel_process_count=STREAM_UPLOAD_PARALLEL)
+        upload_manager.upload_stream(namespace, bucket_name, object_name, response.raw, part_size=STREAM_PART_SIZE)
+    print(f"🌊 Streamed {attachment.get('name')} ({attachment.get('size')} bytes) to {object_name}")
 
 # === ATTACHMENT HANDLING ===
 def extract_so_number(subject):
     return subject.upper()
 
-def upload_attachment_to_oci(attachment, so_number, bucket_name, config, email_id):
+# === CONTENT HASH INDEX ===
+# attachments/hash_index/<sha256>.json records the first upload of a byte-identical
+# attachment and, once step two has parsed it, the LLM extraction to reuse.
+HASH_INDEX_PREFIX = "attachments/hash_index/"
+
+def content_hash(binary_data):
+    return hashlib.sha256(binary_data).hexdigest()
+
+def load_hash_index_entry(bucket_name, config, sha):
+    client = get_oci_client(config)
+    namespace = get_namespace(client)
+    try:
+        obj = client.get_object(namespace, bucket_name, f"{HASH_INDEX_PREFIX}{sha}.json")
+        return json.loads(obj.data.content.decode("utf-8"))
+    except oci.exceptions.ServiceError as e:
+        if e.status == 404:
+            return None
+        else:
+            raise
+
+def save_hash_index_entry(bucket_name, config, sha, entry, only_if_new=False):
+    client = get_oci_client(config)
+    namespace = get_namespace(client)
+    kwargs = {"if_none_match": "*"} if only_if_new else {}
+    try:
+        client.put_object(namespace, bucket_name, f"{HASH_INDEX_PREFIX}{sha}.json",
+                          json.dumps(entry, indent=2).encode("utf-8"), **kwargs)
+    except oci.exceptions.ServiceError as e:
+        if not (only_if_new and e.status == 412):  # already indexed by an earlier email
+            raise
+
+# IMAGE_EXTENSIONS: what Document AI reads as-is; HEIC/HEIF always need converting
+CONVERTIBLE_IMAGE_EXTENSIONS = IMAGE_EXTENSIONS + HEIF_EXTENSIONS
+
+def needs_pdf_conversion(ext):
+    return ext in CONVERTIBLE_IMAGE_EXTENSIONS and not (IMAGE_DIRECT_OCR and ext in IMAGE_EXTENSIONS)
+
+def image_to_pdf_bytes(binary_data):
+    # in memory; every frame of a multi-page TIFF becomes a PDF page
+    with Image.open(io.BytesIO(binary_data)) as image:
+        pages = [frame.convert("RGB") for frame in ImageSequence.Iterator(image)]
+    output = io.BytesIO()
+    pages[0].save(output, "PDF", save_all=True, append_images=pages[1:])
+    return output.getvalue()
+
+_image_pool = None
+_image_pool_lock = threading.Lock()
+
+def convert_image_to_pdf(binary_data):
+    # big images are CPU-heavy: convert them in a worker process, off the ingestion thread
+    global _image_pool
+    if len(binary_data) < IMAGE_POOL_MIN_BYTES:
+        return image_to_pdf_bytes(binary_data)
+    with _image_pool_lock:
+        if _image_pool is None:
+            # spawn, not fork: forking this heavily threaded process can deadlock the child
+            _image_pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _image_pool.submit(image_to_pdf_bytes, binary_data).result()
+
+def decode_attachment(attachment, email_id, headers=None):
+    content_base64 = attachment.get("contentBytes")
+    if content_base64 is None:  # large attachment, not inlined by fetch_attachments_batch
+        return download_attachment_bytes(email_id, attachment, headers)
+    return base64.b64decode(content_base64)
+
+def copy_or_upload(config, bucket_name, source_name, destination_name, upload):
+    # server-side copy needs the objectstorage-<region> service IAM policy; if it
+    # fails for any reason, upload() writes the object from this side instead
+    try:
+        copy_object_server_side(config, bucket_name, source_name, destination_name)
+    except Exception as e:
+        print(f"[⚠️ Copy failed] {source_name} → {destination_name} ({e}) — uploading instead")
+        upload()
+
+def upload_attachment_to_oci(attachment, so_number, bucket_name, config, email_id, headers=None):
+    """
+    Uploads the original once to attachments/all_attachments/ and derives the
+    attachments/unprocessed/ copy from it server-side. Only images, which are
+    converted to PDF, need a second client upload.
+    """
     if attachment.get("@odata.type") != "#microsoft.graph.fileAttachment":
         return None
 
     filename = attachment.get("name", "unnamed_file")
-    content_base64 = attachment.get("contentBytes")
-    binary_data = base64.b64decode(content_base64)
-    
     # Extract file extension
     ext = os.path.splitext(filename)[-1].lower()
-    
-    client = get_oci_client(config)
-    namespace = get_namespace(client)
 
-    # Convert image formats (png, jpg) to PDF before upload
-    if ext in [".png", ".jpg", ".jpeg"]:
-        with NamedTemporaryFile(suffix=ext) as temp_image_file:
-            temp_image_file.write(binary_data)
-            temp_image_file.flush()
-            image = Image.open(temp_image_file.name).convert("RGB")
-            with NamedTemporaryFile(suffix=".pdf") as temp_pdf_file:
-                image.save(temp_pdf_file.name, "PDF")
-                temp_pdf_file.seek(0)
-                binary_data = temp_pdf_file.read()
-                filename = filename.rsplit(".", 1)[0] + ".pdf"  # rename as .pdf
-
-    object_name = f"attachments/unprocessed/{so_number}_{email_id}/{email_id}_{filename}"
-    client.put_object(namespace, bucket_name, object_name, binary_data)
+    if attachment.get("contentBytes") is None and not needs_pdf_conversion(ext):
+        # large attachment: streamed once into the archive, never held in memory
+        archive_object = upload_all_attachment_to_oci(attachment, so_number, bucket_name, config, email_id, headers)
+        object_name = f"attachments/unprocessed/{so_number}_{email_id}/{email_id}_{filename}"
+        copy_or_upload(config, bucket_name, archive_object, object_name,
+                       lambda: stream_attachment_to_oci(email_id, attachment, object_name, bucket_name, config, headers))
+        return filename
+
+    binary_data = decode_attachment(attachment, email_id, headers)  # the only decode
+    sha = content_hash(binary_data)  # of the original bytes, before any PDF conversion
+    archive_object = upload_all_attachment_to_oci(
+        attachment, so_number, bucket_name, config, email_id, headers, binary_data=binary_data, sha=sha
+    )
+
+    # Convert image formats to PDF before upload, unless OCR takes the image directly
+    if needs_pdf_conversion(ext):
+        binary_data = convert_image_to_pdf(binary_data)
+        filename = filename.rsplit(".", 1)[0] + ".pdf"  # rename as .pdf
+
+        object_name = f"attachments/unprocessed/{so_number}_{email_id}/{email_id}_{filename}"
+        client = get_oci_client(config)
+        namespace = get_namespace(client)
+        client.put_object(namespace, bucket_name, object_name, binary_data, opc_meta={"content-sha256": sha})
+    else:
+        # same bytes as the archive copy (hash metadata included)
+        object_name = f"attachments/unprocessed/{so_number}_{email_id}/{email_id}_{filename}"
+        client = get_oci_client(config)
+        namespace = get_namespace(client)
+        copy_or_upload(config, bucket_name, archive_object, object_name,
+                       lambda: client.put_object(namespace, bucket_name, object_name, binary_data, opc_meta={"content-sha256": sha}))
+
+    save_hash_index_entry(bucket_name, config, sha, {"sha256": sha, "first_object": object_name}, only_if_new=True)
     return filename
 
-def upload_all_attachment_to_oci(attachment, so_number, bucket_name, config, email_id):
+def upload_all_attachment_to_oci(attachment, so_number, bucket_name, config, email_id, headers=None, binary_data=None, sha=None):
+    # archive copy of the original attachment; returns its object name
     if attachment.get("@odata.type") != "#microsoft.graph.fileAttachment":
         return None
 
     filename = attachment.get("name", "unnamed_file")
-    content_base64 = attachment.get("contentBytes")
-    binary_data = base64.b64decode(content_base64)
-    
     object_name = f"attachments/all_attachments/{so_number}/{email_id}_{filename}"
+
+    if binary_data is None and attachment.get("contentBytes") is None:
+        stream_attachment_to_oci(email_id, attachment, object_name, bucket_name, config, headers)
+        return object_name
+    if binary_data is None:
+        binary_data = decode_attachment(attachment, email_id, headers)
+    
     client = get_oci_client(config)
     namespace = get_namespace(client)
-    client.put_object(namespace, bucket_name, object_name, binary_data)
-    return filename
+    opc_meta = {"content-sha256": sha or content_hash(binary_data)}
+    client.put_object(namespace, bucket_name, object_name, binary_data, opc_meta=opc_meta)
+    return object_name
 
 def upload_email_metadata(email, so_number, bucket_name, config, email_uid):
     subject = email.get("subject", "No Subject")
@@ -186,53 +548,142 @@ def upload_email_metadata(email, so_number, bucket_name, config, email_uid):
     client.put_object(namespace, bucket_name, filename, json.dumps(content, indent=2).encode("utf-8"))
 
 # === MAIN STEP ONE FUNCTION ===
-def run_step_one(config):
-    oci_cfg = config["oci"]
+def _outlook_headers(config):
     ms = config["microsoft"]
-    bucket_name = oci_cfg["bucket_name"]
-
     token = get_outlook_token(
         client_id=ms["client_id"],
         tenant_id=ms["tenant_id"],
         scopes=ms["scopes"]
     )
-    headers = {'Authorization': f'Bearer {token}'}
-    last_time = load_last_processed_time(bucket_name, oci_cfg)
-    processed_ids = get_processed_ids(bucket_name, oci_cfg)
-
-    emails = fetch_emails(token, since_iso_datetime=last_time)
-    print(f"📥 Found {len(emails)} emails")
+    return token, {'Authorization': f'Bearer {token}'}
 
-    new_ids = set(processed_ids)
-    latest_seen = last_time
+def _register_email(email, bucket_name, oci_cfg):
+    # (SO number, earlier failure or None) of a new email worth ingesting, else None
+    if FETCH_ONLY_WITH_ATTACHMENTS and not email.get("hasAttachments"):
+        return None
 
-    for email in emails:
+    subject = email.get("subject", "")
+    so_number = extract_so_number(subject)
+    if not so_number:
+        return None
+    if email_already_ingested(bucket_name, oci_cfg, so_number, email["id"]):
+        return None
+    failure = load_email_failure(bucket_name, oci_cfg, so_number, email["id"])
+    if failure and failure.get("dead_lettered"):
+        return None
+    return so_number, failure
+
+def _ingest_attachments(to_ingest, bucket_name, oci_cfg, headers):
+    """
+    Uploads the attachments of every (email, so_number, failure) and marks each
+    email as ingested. One email failing does not stop the others: it stays
+    unmarked for a retry, or is dead-lettered after EMAIL_MAX_ATTEMPTS.
+    Returns {"failed": [email ids to retry], "dead_lettered": [email ids]}.
+    """
+    # attachments of every new email in a few $batch round-trips
+    attachments_by_email = fetch_attachments_batch([email["id"] for email, _, _ in to_ingest], headers)
+    result = {"failed": [], "dead_lettered": []}
+    for email, so_number, failure in to_ingest:
         email_id = email["id"]
-        if email_id in processed_ids:
-            continue
-
-        subject = email.get("subject", "")
-        so_number = extract_so_number(subject)
-        if not so_number:
+        try:
+            attachments = attachments_by_email.get(email_id)
+            if attachments is None:
+                raise Exception("could not fetch attachments from Graph")
+            for a in attachments:
+                # one decode/upload; the second copy is made server-side
+                uploaded = upload_attachment_to_oci(a, so_number, bucket_name, oci_cfg, email_id, headers)
+                if uploaded:
+                    print(f"📎 Uploaded {uploaded} for SO {so_number}")
+        except Exception as e:
+            entry = record_email_failure(bucket_name, oci_cfg, email, so_number, e)
+            if entry["dead_lettered"]:
+                print(f"[☠️ Dead-lettered] {email_id} (SO {so_number}) after {entry['attempts']} attempts: {e}")
+                result["dead_lettered"].append(email_id)
+            else:
+                print(f"[❌ Attachment ingest failed] {email_id} (SO {so_number}), attempt {entry['attempts']}: {e}")
+                result["failed"].append(email_id)
             continue
-
+        # the metadata object marks the email as ingested, so it is written last
         # uid = generate_email_uid(email_id)
         upload_email_metadata(email, so_number, bucket_name, oci_cfg, email_id)
+        if failure:
+            clear_email_failure(bucket_name, oci_cfg, so_number, email_id)
+    return result
 
-        attachments = fetch_attachments(email_id, headers)
-        for a in attachments:
-            uploaded = upload_attachment_to_oci(a, so_number, bucket_name, oci_cfg, email_id)
-            uploaded = upload_all_attachment_to_oci(a, so_number, bucket_name, oci_cfg, email_id)
-            if uploaded:
-                print(f"📎 Uploaded {uploaded} for SO {so_number}")
+def run_step_one(config):
+    oci_cfg = config["oci"]
+    bucket_name = oci_cfg["bucket_name"]
+
+    token, headers = _outlook_headers(config)
+    last_time = load_last_processed_time(bucket_name, oci_cfg)
+    sync_state = {"delta_link": load_delta_link(bucket_name, oci_cfg)}
+    start_link = sync_state["delta_link"]
+
+    latest_seen = last_time
+    email_count = 0
+    to_ingest = []  # (email, so_number, earlier failure)
+
+    for email in iter_inbox_delta(token, sync_state, since_iso_datetime=last_time):
+        email_count += 1
+        registered = _register_email(email, bucket_name, oci_cfg)
+        if not registered:
+            continue
+        so_number, failure = registered
+        to_ingest.append((email, so_number, failure))
 
-        new_ids.add(email_id)
         rcv = email.get("receivedDateTime")
         if rcv and (not latest_seen or rcv > latest_seen):
             latest_seen = rcv
 
-    save_processed_ids(bucket_name, oci_cfg, new_ids)
+    print(f"📥 Found {email_count} new or changed emails")
+
+    result = _ingest_attachments(to_ingest, bucket_name, oci_cfg, headers)
+    if result["failed"]:
+        # the delta link stays where it was, so the next poll replays these emails;
+        # the ones that did get in are skipped as already ingested
+        print(f"[⚠️ Step One partial] {len(result['failed'])} emails will be retried: {result['failed']}")
+        return result
+    # saved only after every message is handled, so a crash replays this poll
+    if sync_state["delta_link"] and sync_state["delta_link"] != start_link:
+        save_delta_link(bucket_name, oci_cfg, sync_state["delta_link"])
     if latest_seen:
         save_last_processed_time(bucket_name, oci_cfg, latest_seen)
     print("✅ Step One Complete")
+    return result
+
+def run_step_one_for_messages(config, email_ids):
+    """
+    Step one for messages announced by Graph change notifications: fetches just those
+    messages (one $batch) instead of syncing the inbox. The delta link is left alone,
+    so the next poll still sees them and skips them as already ingested.
+    """
+    oci_cfg = config["oci"]
+    bucket_name = oci_cfg["bucket_name"]
+    email_ids = list(dict.fromkeys(email_ids))
+    if not email_ids:
+        return {"failed": [], "dead_lettered": []}
+
+    _, headers = _outlook_headers(config)
+    responses = graph_batch(
+        [
+            {"id": str(i), "method": "GET", "url": f"/me/messages/{email_id}?$select={EMAIL_SELECT_FIELDS}"}
+            for i, email_id in enumerate(email_ids)
+        ],
+        headers,
+    )
 
+    to_ingest = []  # (email, so_number, earlier failure)
+    for i, email_id in enumerate(email_ids):
+        item = responses.get(str(i)) or {}
+        if item.get("status") != 200:
+            # deleted or moved before we got to it; the safety poll covers the rest
+            print(f"[⚠️ Notified email unavailable] {email_id}: HTTP {item.get('status')}")
+            continue
+        registered = _register_email(item["body"], bucket_name, oci_cfg)
+        if registered:
+            to_ingest.append((item["body"], *registered))
+
+    print(f"📥 {len(email_ids)} notified emails, {len(to_ingest)} to ingest")
+    result = _ingest_attachments(to_ingest, bucket_name, oci_cfg, headers)
+    print("✅ Step One Complete")
+    return result
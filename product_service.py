@@ -1,11 +1,10 @@
 from Post_processing.business_rules import map_product_type, validate_category
-from odoo_services.utils import get_odoo_connection
+from odoo_services.utils import get_cached_reference, get_odoo_session, named_locks, set_cached_reference
 
-models, db, uid, password = get_odoo_connection()
+odoo = get_odoo_session()  # lazy: no login at import
 
 def get_or_create_technology(name):
-    tech_ids = models.execute_kw(
-        db, uid, password,
+    tech_ids = odoo.execute_kw(
         'x_technology', 'search',
         [[['x_name', '=', name]]],  
         {'limit': 1}
@@ -15,24 +14,44 @@ def get_or_create_technology(name):
         print(f"[✔️ Found] Technology '{name}' with ID: {tech_ids[0]}")
         return tech_ids[0]
     else:
-        tech_id = models.execute_kw(
-            db, uid, password,
+        tech_id = odoo.execute_kw(
             'x_technology', 'create',
             [{'x_name': name}]
         )
         print(f"[✅ Created] Technology '{name}' with ID: {tech_id}")
         return tech_id
 
+def get_category_ids(category_names):
+    # {name: id} for the categories that exist; cached ones cost no RPC
+    category_map = {}
+    uncached = []
+    for name in set(category_names):
+        category_id = get_cached_reference(("category", name))
+        if category_id:
+            category_map[name] = category_id
+        else:
+            uncached.append(name)
+
+    if uncached:
+        categories = odoo.execute_kw(
+            'product.category', 'search_read',
+            [[['name', 'in', uncached]]],
+            {'fields': ['name'], 'order': 'id'}
+        )
+        for category in categories:
+            if category['name'] not in category_map:
+                category_map[category['name']] = category['id']
+                set_cached_reference(("category", category['name']), category['id'])
+    return category_map
+
 def get_or_create_product(part_number, description, product_type, category_name, technology_name):
     
-    tmpl_ids = models.execute_kw(
-        db, uid, password,
+    tmpl_ids = odoo.execute_kw(
         'product.template', 'search',
         [[['default_code', '=', part_number]]]
     )
     if tmpl_ids:
-        product_ids = models.execute_kw(
-            db, uid, password,
+        product_ids = odoo.execute_kw(
             'product.product', 'search',
             [[['product_tmpl_id', '=', tmpl_ids[0]]]]
         )
@@ -50,13 +69,7 @@ def get_or_create_product(part_number, description, product_type, category_name,
     # Step 3: Search category (we assume it's pre-defined and valid)
     category_id = None
     if valid_category:
-        category_ids = models.execute_kw(
-            db, uid, password,
-            'product.category', 'search',
-            [[['name', '=', valid_category]]]
-        )
-        if category_ids:
-            category_id = category_ids[0]
+        category_id = get_category_ids([valid_category]).get(valid_category)
             
             
             
@@ -78,14 +91,12 @@ def get_or_create_product(part_number, description, product_type, category_name,
         # Remove all None values from the dict before pushing to Odoo
         data = {k: v for k, v in data.items() if v is not None}
 
-        tmpl_id = models.execute_kw(
-            db, uid, password,
+        tmpl_id = odoo.execute_kw(
             'product.template', 'create',
             [data]
         )
 
-    product_ids = models.execute_kw(
-        db, uid, password,
+    product_ids = odoo.execute_kw(
         'product.product', 'search',
         [[['product_tmpl_id', '=', tmpl_id]]]
     )
@@ -93,3 +104,109 @@ def get_or_create_product(part_number, description, product_type, category_name,
 
     return product_ids[0]
 
+
+
+def get_or_create_technologies(tech_names):
+    # {name: id}; missing technologies are created in one call
+    with named_locks("technology", tech_names):
+        tech_map = {}
+        techs = odoo.execute_kw(
+            'x_technology', 'search_read',
+            [[['x_name', 'in', list(tech_names)]]],
+            {'fields': ['x_name'], 'order': 'id'}
+        )
+        for tech in techs:
+            tech_map.setdefault(tech['x_name'], tech['id'])
+        new_techs = sorted(set(tech_names) - set(tech_map))
+        if new_techs:
+            new_ids = odoo.execute_kw(
+                'x_technology', 'create',
+                [[{'x_name': name} for name in new_techs]]
+            )
+            tech_map.update(zip(new_techs, new_ids))
+            print(f"[✅ Created] Technologies {new_techs}")
+    return tech_map
+
+def get_or_create_products(product_specs, product_names=None):
+    """
+    Bulk version of get_or_create_product.
+    product_specs: list of dicts with internal_reference, description, type, category, technology.
+    Returns {internal_reference: product_id}; the first spec wins for repeated references.
+    If product_names is a dict it is filled with {product_id: name} so callers can skip a read.
+    """
+    if product_names is None:
+        product_names = {}
+    specs = {}
+    for spec in product_specs:
+        specs.setdefault(spec["internal_reference"], spec)
+    if not specs:
+        return {}
+
+    # another SO folder creating the same default_code waits for it instead of duplicating it
+    with named_locks("product", specs):
+        return _get_or_create_products(specs, product_names)
+
+def _get_or_create_products(specs, product_names):
+    # 1️⃣ Existing products — one search_read for every reference
+    templates = odoo.execute_kw(
+        'product.template', 'search_read',
+        [[['default_code', 'in', list(specs)]]],
+        {'fields': ['default_code', 'name', 'product_variant_ids'], 'order': 'id'}
+    )
+    product_map = {}
+    for tmpl in templates:
+        code = tmpl['default_code']
+        if code not in product_map and tmpl['product_variant_ids']:
+            product_map[code] = tmpl['product_variant_ids'][0]
+            product_names[product_map[code]] = tmpl['name']
+
+    missing = [spec for ref, spec in specs.items() if ref not in product_map]
+    if not missing:
+        return product_map
+
+    # 2️⃣ Technologies and categories resolved as sets
+    tech_names = {spec['technology'] for spec in missing if spec.get('technology')}
+    tech_map = get_or_create_technologies(tech_names) if tech_names else {}
+
+    category_by_ref = {spec['internal_reference']: validate_category(spec.get('category')) for spec in missing}
+    category_names = {c for c in category_by_ref.values() if c}
+    category_map = get_category_ids(category_names) if category_names else {}
+
+    # 3️⃣ Create every missing product in one call
+    vals_list = []
+    for spec in missing:
+        data = {
+            'name': spec.get('description'),
+            'default_code': spec['internal_reference'],
+            'type': map_product_type(spec.get('type'), "consu"),
+            'list_price': 1.0,
+            'standard_price': 0.0,
+            'sale_ok': True,
+            'purchase_ok': False,
+            'categ_id': category_map.get(category_by_ref[spec['internal_reference']]),
+            'x_technology_id': tech_map.get(spec.get('technology')),
+        }
+        # Remove all None values from the dict before pushing to Odoo
+        vals_list.append({k: v for k, v in data.items() if v is not None})
+
+    tmpl_ids = odoo.execute_kw(
+        'product.template', 'create',
+        [vals_list]
+    )
+    variants = odoo.execute_kw(
+        'product.product', 'search_read',
+        [[['product_tmpl_id', 'in', tmpl_ids]]],
+        {'fields': ['product_tmpl_id'], 'order': 'id'}
+    )
+    product_by_tmpl = {}
+    for variant in variants:
+        product_by_tmpl.setdefault(variant['product_tmpl_id'][0], variant['id'])
+
+    for spec, tmpl_id in zip(missing, tmpl_ids):
+        product_id = product_by_tmpl.get(tmpl_id)
+        product_map[spec['internal_reference']] = product_id
+        if product_id and spec.get('description'):
+            product_names[product_id] = spec['description']
+    print(f"[✅ PRODUCTS CREATED] {len(tmpl_ids)} templates")
+
+    return product_map
@@ -1,13 +1,12 @@
 import datetime
 from Post_processing.business_rules import safe_price, sanitize_float, sanitize_xml_string
-from odoo_services.utils import get_odoo_connection, currency
+from odoo_services.utils import cached_reference, get_odoo_session, currency
 
-models, db, uid, password = get_odoo_connection()
+odoo = get_odoo_session()  # lazy: no login at import
 
 def get_or_create_pr(sin, order_id, sector_id, region_id):
     # look for existing PR linked to this SO
-    pr_ids = models.execute_kw(
-        db, uid, password,
+    pr_ids = odoo.execute_kw(
         'purchase.requisition', 'search',
         [[['origin', '=', sin]]],
         {'limit': 1}
@@ -18,8 +17,7 @@ def get_or_create_pr(sin, order_id, sector_id, region_id):
         print(f"[✔️ PR FOUND] PR ID: {pr_id}")
     else:
               
-        pr_id = models.execute_kw(
-            db, uid, password,
+        pr_id = odoo.execute_kw(
             'purchase.requisition', 'create',
             [{
                 'origin': sin,
@@ -34,8 +32,30 @@ def get_or_create_pr(sin, order_id, sector_id, region_id):
         
     return pr_id
 
+def get_product_names(items):
+    # names already known from product resolution, one batched read for the rest
+    names = {
+        item["product_id"]: item["product_name"]
+        for item in items
+        if item.get("product_id") and item.get("product_name")
+    }
+    missing = sorted({item["product_id"] for item in items if item.get("product_id")} - set(names))
+    if missing:
+        products = odoo.execute_kw(
+            'product.product', 'read',
+            [missing],
+            {'fields': ['name']}
+        )
+        names.update({p['id']: p['name'] for p in products})
+    return names
+
 def add_pr_lines(pr_id, items, sector_id, region_id, unit_uom_id):
 
+    product_names = get_product_names(items)
+
+    # Collect all line commands
+    commands = []
+
     for item in items:
         product_id = item.get("product_id")
         if not product_id:
@@ -43,18 +63,10 @@ def add_pr_lines(pr_id, items, sector_id, region_id, unit_uom_id):
             continue
 
         qty = sanitize_float(item.get("Quantity"))
-
-        product_data = models.execute_kw(
-            db, uid, password,
-            'product.product', 'read',
-            [product_id],
-            {'fields': ['name']}
-        )
-        product_name = sanitize_xml_string(product_data[0]['name'])
+        product_name = sanitize_xml_string(product_names.get(product_id))
 
         data = {
             'product_id': product_id,
-            'requisition_id': pr_id,
             'product_qty': qty,
             'price_unit': 0.0,
             'name': product_name,
@@ -65,17 +77,22 @@ def add_pr_lines(pr_id, items, sector_id, region_id, unit_uom_id):
         }
 
         data = {k: v for k, v in data.items() if v is not None}
+        commands.append((0, 0, data))
 
-        models.execute_kw(
-            db, uid, password,
-            'purchase.requisition.line', 'create',
-            [data]
-        )
-        print(f"[➕ PR LINE ADDED] Product ID {product_id} qty={qty} to PR {pr_id}")
+    if not commands:
+        print("[ℹ️] No PR lines to add.")
+        return
+
+    # every line in one write on the requisition's one2many
+    odoo.execute_kw(
+        'purchase.requisition', 'write',
+        [[pr_id], {'line_ids': commands}]
+    )
+    print(f"[➕ PR LINES ADDED] {len(commands)} lines → PR {pr_id}")
 
 def create_rfq(pr_id, vendor_id, vendor_name, sector_id, region_id, pr_name, project_mgr_id, currency_code):
     
-    currency_id = currency(models, db, uid, password, currency_code)
+    currency_id = currency(odoo, currency_code)
     
     data = {
             'partner_id': vendor_id,
@@ -91,8 +108,7 @@ def create_rfq(pr_id, vendor_id, vendor_name, sector_id, region_id, pr_name, pro
          # 🚨 Clean: Remove keys with None to avoid marshaling errors
     data = {k: v for k, v in data.items() if v is not None}
    
-    po_id = models.execute_kw(
-        db, uid, password,
+    po_id = odoo.execute_kw(
         'purchase.order', 'create',
         [data]
     )
@@ -100,20 +116,39 @@ def create_rfq(pr_id, vendor_id, vendor_name, sector_id, region_id, pr_name, pro
     return po_id
 
 
+def get_vat_tax_id(tax_name='VAT goods Purchases-STD - 15% '):
+
+    def _load():
+        vat_tax_ids = odoo.execute_kw(
+            'account.tax', 'search',
+            [[['name', 'ilike', tax_name]]],
+            {'limit': 1}
+        )
+        return vat_tax_ids[0] if vat_tax_ids else False
+
+    return cached_reference(("tax", tax_name), _load)
+
+def get_payment_term_id(term_name):
+
+    def _load():
+        payment_terms = odoo.execute_kw(
+            'account.payment.term', 'search_read',
+            [[['name', '=', term_name]]],
+            {'fields': ['id'], 'limit': 1}
+        )
+        return payment_terms[0]['id'] if payment_terms else None
+
+    return cached_reference(("payment_term", term_name), _load)
+
 def add_rfq_lines(po_id, product_items, sector_id, region_id, unit_uom_id):
 
     # Step 1: Get tax ID
-    vat_tax_ids = models.execute_kw(
-        db, uid, password,
-        'account.tax', 'search',
-        [[['name', 'ilike', 'VAT goods Purchases-STD - 15% ']]],
-        {'limit': 1}
-                    )
-    
-    vat_tax_id = vat_tax_ids[0] if vat_tax_ids else False
+    vat_tax_id = get_vat_tax_id()
     if not vat_tax_id:
         raise Exception("VAT tax not found")
 
+    product_names = get_product_names(product_items)
+
     # Collect all line commands
     commands = []
 
@@ -127,13 +162,7 @@ def add_rfq_lines(po_id, product_items, sector_id, region_id, unit_uom_id):
         price_unit = sanitize_float(item.get("Unit Price"))
         price_unit = safe_price(price_unit)
 
-        product_data = models.execute_kw(
-            db, uid, password,
-            'product.product', 'read',
-            [product_id],
-            {'fields': ['name']}
-        )
-        name = sanitize_xml_string(product_data[0]['name'])
+        name = sanitize_xml_string(product_names.get(product_id))
 
         vals = {
             'product_id': product_id,
@@ -157,8 +186,7 @@ def add_rfq_lines(po_id, product_items, sector_id, region_id, unit_uom_id):
         return
 
     try:
-        models.execute_kw(
-            db, uid, password,
+        odoo.execute_kw(
             'purchase.order', 'write',
             [[po_id], {'order_line': commands}]
         )
@@ -180,22 +208,14 @@ def apply_standard_note_and_payment_term(po_id, term_name='2 Months'):
     """.strip()
 
     # Search for payment term by name
-    payment_terms = models.execute_kw(
-        db, uid, password,
-        'account.payment.term', 'search_read',
-        [[['name', '=', term_name]]],
-        {'fields': ['id'], 'limit': 1}
-    )
+    term_id = get_payment_term_id(term_name)
 
-    if not payment_terms:
+    if not term_id:
         print(f"[⚠️ Warning] Payment term '{term_name}' not found. Skipping.")
         return
 
-    term_id = payment_terms[0]['id']
-
     # Update PO
-    models.execute_kw(
-        db, uid, password,
+    odoo.execute_kw(
         'purchase.order', 'write',
         [[po_id], {'notes': note_text, 'payment_term_id': term_id}]
     )
@@ -1,15 +1,23 @@
+from concurrent.futures import ThreadPoolExecutor
+from config import ODOO_RFQ_WORKERS
 from Post_processing.business_rules import sanitize_float, sanitize_item, sanitize_xml_string
 from odoo_services.sales_order_service import get_sales_order, find_sector_region, patch_so_lines
-from odoo_services.product_service import get_or_create_product
+from odoo_services.product_service import get_or_create_products
 from odoo_services.vendor_service import get_or_create_vendor
 from odoo_services.purchase_service import apply_standard_note_and_payment_term, get_or_create_pr, add_pr_lines, create_rfq, add_rfq_lines
-from odoo_services.utils import get_UoM, get_currency_code
-from odoo_services.utils import get_odoo_connection
+from odoo_services.utils import get_UoM, get_currency_code, named_lock
+from odoo_services.utils import get_odoo_session
 
-models, db, uid, password = get_odoo_connection()
+odoo = get_odoo_session()  # lazy: no login at import
 
 # Main pipeline
-def process_quotation_data(data):
+def process_quotation_data(data, progress=None):
+    """
+    Pushes one SO payload to Odoo. progress records what is already done (PR lines,
+    RFQ per quotation) and is updated in place, so a retry after a failed vendor
+    redoes only what is missing instead of duplicating PR lines and RFQs.
+    """
+    progress = {} if progress is None else progress
     print("[⚙️ Processing]", data["SIN"])
     sin = data["SIN"]
 
@@ -18,8 +26,7 @@ def process_quotation_data(data):
         print(f"[⚠️ WARNING] Sales Order {sin} not found — skipping.")
         return  # stop this SIN, but system keeps running
     
-    so_data = models.execute_kw(
-        db, uid, password,
+    so_data = odoo.execute_kw(
         'sale.order', 'read',
         [order_id],
         {'fields': ['sector_id', 'region_id',  'opportunity_id', 'project_mgr']}
@@ -27,12 +34,13 @@ def process_quotation_data(data):
     project_mgr = so_data[0].get('project_mgr')
     project_mgr_id = project_mgr[0] if project_mgr else False
     
-    unit_uom_id = get_UoM(models, db, uid, password)
+    unit_uom_id = get_UoM(odoo)
 
 
     sector_id, region_id =  find_sector_region(so_data)
 
     product_tuples = []
+    product_specs = []
     
     for quotation in data["quotations"]:
         for item in quotation["Items"]:
@@ -47,17 +55,27 @@ def process_quotation_data(data):
             else:
                 internal_reference=item.get("Part Number")
 
-            product_id = get_or_create_product(
-                internal_reference,
-                description,
-                item.get("Type"),
-                item.get("Category"),
-                item.get("Technology"),
-            )
+            item["internal_reference"] = internal_reference
+            product_specs.append({
+                "internal_reference": internal_reference,
+                "description": description,
+                "type": item.get("Type"),
+                "category": item.get("Category"),
+                "technology": item.get("Technology"),
+            })
 
+    # one lookup/create round for every item of the payload
+    product_names = {}
+    product_map = get_or_create_products(product_specs, product_names)
+
+    for quotation in data["quotations"]:
+        for item in quotation["Items"]:
+            internal_reference = item["internal_reference"]
+            product_id = product_map.get(internal_reference)
             qty = sanitize_float(item.get("Quantity"))
             product_tuples.append( (product_id, qty) )
             item["product_id"] = product_id  
+            item["product_name"] = product_names.get(product_id)
             print(f"[🟢 PRODUCT] Created or found: {internal_reference} → Product ID: {product_id}")
     
     pr_id = get_or_create_pr(sin, order_id, sector_id, region_id)
@@ -66,29 +84,63 @@ def process_quotation_data(data):
         product_items.extend(quotation["Items"])
 
 
-    add_pr_lines(pr_id, product_items, sector_id, region_id, unit_uom_id)
+    if progress.get("pr_lines_added") == pr_id:
+        print(f"[↩️ PR lines already added] PR {pr_id}")
+    else:
+        add_pr_lines(pr_id, product_items, sector_id, region_id, unit_uom_id)
+        progress["pr_lines_added"] = pr_id
 
 
     # now get the PR name
-    pr_data = models.execute_kw(
-        db, uid, password,
+    pr_data = odoo.execute_kw(
         'purchase.requisition', 'read',
         [pr_id],
         {'fields': ['name']}
     )
     pr_name = pr_data[0]['name']
 
-    # 5️⃣ for each vendor → create RFQ → add their items
-    for quotation in data.get("quotations", []):
+    # 5️⃣ for each vendor → create RFQ → add their items (vendors in parallel)
+    quotations = data.get("quotations", [])
+    rfq_progress = progress.setdefault("rfqs", {})  # "<index>:<vendor>" -> {"po_id", "done"}
+
+    def _create_vendor_rfq(index, quotation):
         vendor_info = quotation.get("Vendor", {})
-        vendor_id = get_or_create_vendor(vendor_info)
-        # currency_code = quotation.get("Items", [{}])[0].get("Currency") or "SAR"
-        currency_code = get_currency_code(quotation)
-        po_id = create_rfq(pr_id, vendor_id, vendor_info, sector_id, region_id, pr_name, project_mgr_id, currency_code)
+        key = f"{index}:{vendor_info.get('name')}"
+        done = rfq_progress.get(key) or {}
+        if done.get("done"):
+            print(f"[↩️ RFQ already created] {vendor_info.get('name')} → RFQ ID: {done['po_id']}")
+            return done["po_id"]
+
+        po_id = done.get("po_id")
+        if not po_id:
+            # same vendor in two quotations or two SO folders → created once
+            with named_lock("vendor", vendor_info.get("name")):
+                vendor_id = get_or_create_vendor(vendor_info)
+            # currency_code = quotation.get("Items", [{}])[0].get("Currency") or "SAR"
+            currency_code = get_currency_code(quotation)
+            po_id = create_rfq(pr_id, vendor_id, vendor_info, sector_id, region_id, pr_name, project_mgr_id, currency_code)
+            rfq_progress[key] = {"po_id": po_id, "done": False}
         apply_standard_note_and_payment_term(po_id)
         add_rfq_lines(po_id, quotation["Items"], sector_id, region_id, unit_uom_id)
+        rfq_progress[key] = {"po_id": po_id, "done": True}
+        return po_id
+
+    rfq_results = []
+    with ThreadPoolExecutor(max_workers=max(1, min(ODOO_RFQ_WORKERS, len(quotations)))) as pool:
+        futures = [pool.submit(_create_vendor_rfq, i, q) for i, q in enumerate(quotations)]
+        # results in quotation order, whatever order the vendors finish in
+        for quotation, future in zip(quotations, futures):
+            vendor_name = quotation.get("Vendor", {}).get("name")
+            try:
+                rfq_results.append({"vendor": vendor_name, "po_id": future.result(), "error": None})
+            except Exception as e:
+                print(f"[❌ RFQ Failed] {vendor_name} → {e}")
+                rfq_results.append({"vendor": vendor_name, "po_id": None, "error": str(e)})
+
+    # one failed vendor fails the folder: files stay in unprocessed/ for a retry
+    failed = [r for r in rfq_results if r["error"]]
+    if failed:
+        raise Exception(f"RFQ failed for {len(failed)} of {len(rfq_results)} vendors: " + "; ".join(f"{r['vendor']}: {r['error']}" for r in failed))
         
     patch_so_lines(order_id, sector_id, region_id)
-    
-
-
+    return rfq_results
@@ -1,39 +1,59 @@
 from config import FINGERPRINT, KEY_FILE, MICROSOFT_CONFIG, OCI_CONFIG, BUCKET_NAME, REGION, TENANCY, OCI_USER
-from outlook_to_oci import run_step_one
+from outlook_to_oci import run_step_one, run_step_one_for_messages
+from oci_utils import get_oci_stats
+from llm_services.llm_cache import get_cache_stats
 
 from oci_to_odoo import (
-    classify_file,
-    extract_text,
-    extract_quotation_data,
+    analyze_document,
+    extract_quotation_data_many,
     process_quotation_data,
-    get_odoo_connection,
     run_step_two_all
 )
 
-def run_full_pipeline():
-    print("🚀 Starting Full Pipeline\n")
-    
-    config = {
+def build_config():
+    return {
         "oci": {
             "bucket_name": BUCKET_NAME,
             **OCI_CONFIG
         },
         "microsoft": MICROSOFT_CONFIG
     }
+
+def run_full_pipeline(email_ids=None):
+    # email_ids: messages from Graph change notifications → step one fetches only those
+    print("🚀 Starting Full Pipeline\n")
+    oci_stats_before = get_oci_stats()
+    llm_cache_before = get_cache_stats()
+    
+    config = build_config()
     
     print("\n📥 STEP ONE: Fetching Emails & Uploading Attachments")
-    run_step_one(config)
+    # step two works on what is already in OCI, so it runs even if step one did not finish
+    try:
+        if email_ids is None:
+            step_one = run_step_one(config)
+        else:
+            step_one = run_step_one_for_messages(config, email_ids)
+        if step_one["dead_lettered"]:
+            print(f"[☠️ Dead-lettered emails] {step_one['dead_lettered']} — see metadata/failed_emails/")
+    except Exception as e:
+        print(f"[❌ Step One failed] {e} — continuing with step two")
     
     print("\n📂 STEP TWO: Processing Attachments & Pushing to Odoo")
     run_step_two_all(
         config,
-        classify_file,
-        extract_text,
-        extract_quotation_data,
-        process_quotation_data,
-        get_odoo_connection
+        analyze_document,
+        extract_quotation_data_many,
+        process_quotation_data
     )
 
+    oci_stats_after = get_oci_stats()
+    new_clients = oci_stats_after["clients_created"] - oci_stats_before["clients_created"]
+    namespace_calls = oci_stats_after["namespace_calls"] - oci_stats_before["namespace_calls"]
+    print(f"📊 OCI: {new_clients} new clients, {namespace_calls} namespace calls this run")
+    llm_cache_after = get_cache_stats()
+    print("📊 LLM cache: " + ", ".join(f"{k}={llm_cache_after[k] - llm_cache_before[k]}" for k in llm_cache_after))
+
     print("\n✅ Full Pipeline Complete")
 
 if __name__ == "__main__":
@@ -1,11 +1,10 @@
-from odoo_services.utils import get_odoo_connection
+from odoo_services.utils import get_odoo_session
 
-models, db, uid, password = get_odoo_connection()
+odoo = get_odoo_session()  # lazy: no login at import
 
 
 def get_sales_order(sin):
-    order_ids = models.execute_kw(
-        db, uid, password,
+    order_ids = odoo.execute_kw(
         'sale.order', 'search',
         [[['name', '=', sin]]]
     )
@@ -24,53 +23,57 @@ def find_sector_region(so_data):
 
     print(f"[📄 SECTOR_ID on SO] {sector_id}, [📄 REGION_ID on SO] {region_id}")
     
-    # if we have no opportunity, cannot fallback at all
-    if not opportunity_id:
+    # both set on the SO, or no opportunity to fall back to → no extra read
+    if (sector_id and region_id) or not opportunity_id:
         return sector_id, region_id
-    
-    opp_data = models.execute_kw(
-            db, uid, password,
+
+    missing_fields = [f for f, v in (('sector_id', sector_id), ('region_id', region_id)) if not v]
+    opp_data = odoo.execute_kw(
             'crm.lead', 'read',
             [opportunity_id],
-            {'fields': ['sector_id', 'region_id']}
+            {'fields': missing_fields}
         )
     
     # if missing, fallback to opportunity
-    if (not sector_id) and opportunity_id:
-
+    if not sector_id:
         opp_sector = opp_data[0].get('sector_id')
-        
-        if not sector_id and opp_sector:
+        if opp_sector:
             sector_id = opp_sector[0]
-        
         print(f"[📄 FALLBACK SECTOR_ID from Opportunity] {sector_id}")
 
-    if (not region_id) and opportunity_id:
+    if not region_id:
         opp_region = opp_data[0].get('region_id')
-
-       
-        if not region_id and opp_region:
+        if opp_region:
             region_id = opp_region[0]
-
         print(f"[📄 FALLBACK REGION_ID from Opportunity] {region_id}")
 
     return sector_id, region_id
 
 def patch_so_lines(order_id, sector_id, region_id): 
     
-    so_line_ids = models.execute_kw(
-        db, uid, password,
-        'sale.order.line', 'search',
-        [[['order_id', '=', order_id]]]
+    so_lines = odoo.execute_kw(
+        'sale.order.line', 'search_read',
+        [[['order_id', '=', order_id]]],
+        {'fields': ['sector_id', 'region_id']}
     )
 
-    for so_line_id in so_line_ids:
-        models.execute_kw(
-            db, uid, password,
-            'sale.order.line', 'write',
-            [[so_line_id], {
-                'sector_id': sector_id,
-                'region_id': region_id
-            }]
-        )
-        print(f"[🛠️ PATCHED] SO Line {so_line_id} with sector={sector_id}, region={region_id}")
+    def _id(value):
+        return value[0] if value else False
+
+    # only lines that do not already carry the right values
+    to_patch = [
+        line['id'] for line in so_lines
+        if _id(line.get('sector_id')) != sector_id or _id(line.get('region_id')) != region_id
+    ]
+    if not to_patch:
+        print(f"[ℹ️] SO lines of order {order_id} already have sector={sector_id}, region={region_id}")
+        return
+
+    odoo.execute_kw(
+        'sale.order.line', 'write',
+        [to_patch, {
+            'sector_id': sector_id,
+            'region_id': region_id
+        }]
+    )
+    print(f"[🛠️ PATCHED] {len(to_patch)} SO lines {to_patch} with sector={sector_id}, region={region_id}")
@@ -0,0 +1,20 @@
+import importlib.util
+import os
+import sys
+import types
+
+# Deployed, the modules sit in packages (odoo_services/utils.py, llm_services/llm_parser.py,
+# Preprocessing/..., Post_processing/...) next to config.py and main.py. This tree keeps
+# every module at the project root, so when those packages are not on disk the package
+# names are pointed at the root: `odoo_services.utils` then loads ./utils.py.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+for package in ("llm_services", "odoo_services", "Post_processing", "Preprocessing"):
+    if importlib.util.find_spec(package) is None:
+        module = types.ModuleType(package)
+        module.__path__ = [ROOT]
+        sys.modules[package] = module
+
+# config.py reads .env; the tests never talk to Odoo, but the proxies need a URL
+os.environ.setdefault("ODOO_URL", "http://odoo.invalid")
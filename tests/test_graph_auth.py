@@ -0,0 +1,75 @@
+import sys
+import types
+
+import pytest
+
+import graph_client
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.headers = {}
+
+    def close(self):
+        pass
+
+
+class FakeSession:
+    """Answers with the given statuses in order and records the Authorization header sent."""
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.sent = []
+
+    def request(self, method, url, timeout=None, headers=None, **kwargs):
+        self.sent.append(headers["Authorization"])
+        return FakeResponse(self.statuses.pop(0))
+
+
+@pytest.fixture
+def refreshed(monkeypatch):
+    stale = []
+
+    def refresh_outlook_token(token):
+        stale.append(token)
+        return "fresh" if token == "old" else None
+
+    monkeypatch.setitem(sys.modules, "outlook_to_oci", types.SimpleNamespace(refresh_outlook_token=refresh_outlook_token))
+    return stale
+
+
+def _use(monkeypatch, session):
+    monkeypatch.setattr(graph_client, "get_graph_session", lambda: session)
+
+
+def test_401_refreshes_the_token_and_resends_once(monkeypatch, refreshed):
+    session = FakeSession(401, 202)
+    _use(monkeypatch, session)
+    headers = {"Authorization": "Bearer old"}
+
+    response = graph_client.graph_post("https://graph/reply", headers=headers, json={})
+
+    assert response.status_code == 202
+    assert session.sent == ["Bearer old", "Bearer fresh"]
+    assert refreshed == ["old"]
+    assert headers["Authorization"] == "Bearer fresh"  # later calls with the same dict reuse it
+
+
+def test_second_401_is_returned(monkeypatch, refreshed):
+    session = FakeSession(401, 401)
+    _use(monkeypatch, session)
+
+    response = graph_client.graph_get("https://graph/me", headers={"Authorization": "Bearer old"})
+
+    assert response.status_code == 401
+    assert len(session.sent) == 2
+
+
+def test_unknown_token_is_not_resent(monkeypatch, refreshed):
+    session = FakeSession(401)
+    _use(monkeypatch, session)
+
+    response = graph_client.graph_get("https://graph/me", headers={"Authorization": "Bearer someone-else"})
+
+    assert response.status_code == 401
+    assert session.sent == ["Bearer someone-else"]
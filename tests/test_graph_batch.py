@@ -0,0 +1,144 @@
+import pytest
+
+import graph_client
+from graph_client import GRAPH_BATCH_LIMIT, graph_batch
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None, text=""):
+        self.status_code = status_code
+        self._body = body
+        self.text = text
+
+    def json(self):
+        return self._body
+
+
+class FakeGraph:
+    """
+    Stands in for graph_post on the $batch URL. status_for(request, call_number)
+    decides each sub-request's status; every chunk sent is recorded.
+    """
+    def __init__(self, status_for=lambda request, call: 200, batch_status=200):
+        self.status_for = status_for
+        self.batch_status = batch_status
+        self.chunks = []
+
+    def __call__(self, url, headers=None, json=None):
+        assert url == graph_client.GRAPH_BATCH_URL
+        assert headers["Content-Type"] == "application/json"
+        chunk = json["requests"]
+        self.chunks.append([r["id"] for r in chunk])
+        if self.batch_status != 200:
+            return FakeResponse(self.batch_status, text="batch rejected")
+        call = len(self.chunks)
+        responses = []
+        for r in reversed(chunk):  # Graph does not keep request order
+            status = self.status_for(r, call)
+            headers = {"Retry-After": "3"} if status == 429 else {}
+            responses.append({"id": r["id"], "status": status, "headers": headers, "body": {"url": r["url"]}})
+        return FakeResponse(200, {"responses": responses})
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+    monkeypatch.setattr(graph_client.time, "sleep", slept.append)
+    return slept
+
+
+def _gets(n):
+    return [{"id": str(i), "method": "GET", "url": f"/me/messages/{i}"} for i in range(n)]
+
+
+@pytest.mark.parametrize("count, expected_chunks", [
+    (0, []),
+    (1, [1]),
+    (GRAPH_BATCH_LIMIT, [GRAPH_BATCH_LIMIT]),
+    (GRAPH_BATCH_LIMIT + 1, [GRAPH_BATCH_LIMIT, 1]),
+    (45, [20, 20, 5]),
+])
+def test_requests_are_split_into_chunks_of_the_batch_limit(monkeypatch, sleeps, count, expected_chunks):
+    fake = FakeGraph()
+    monkeypatch.setattr(graph_client, "graph_post", fake)
+
+    results = graph_batch(_gets(count), {"Authorization": "Bearer t"})
+
+    assert [len(chunk) for chunk in fake.chunks] == expected_chunks
+    assert sorted(results, key=int) == [str(i) for i in range(count)]
+    assert all(results[str(i)]["body"]["url"] == f"/me/messages/{i}" for i in range(count))
+    assert sleeps == []
+
+
+def test_throttled_gets_are_resent_after_retry_after(monkeypatch, sleeps):
+    # ids 3 and 21 are throttled on the first round only
+    fake = FakeGraph(lambda r, call: 429 if r["id"] in ("3", "21") and call <= 2 else 200)
+    monkeypatch.setattr(graph_client, "graph_post", fake)
+
+    results = graph_batch(_gets(25), {})
+
+    assert fake.chunks[2] == ["3", "21"]  # both retried together in one extra call
+    assert sleeps == [3.0]
+    assert {results[str(i)]["status"] for i in range(25)} == {200}
+
+
+def test_retries_stop_at_max_retries(monkeypatch, sleeps):
+    fake = FakeGraph(lambda r, call: 429)
+    monkeypatch.setattr(graph_client, "graph_post", fake)
+
+    results = graph_batch(_gets(2), {}, max_retries=2)
+
+    assert len(fake.chunks) == 3  # first try + 2 retries
+    assert len(sleeps) == 2
+    assert results["0"]["status"] == 429
+
+
+@pytest.mark.parametrize("status, retried", [(429, True), (503, False), (504, False)])
+def test_non_get_sub_requests_are_only_retried_on_429(monkeypatch, sleeps, status, retried):
+    fake = FakeGraph(lambda r, call: status if call == 1 else 202)
+    monkeypatch.setattr(graph_client, "graph_post", fake)
+
+    results = graph_batch([{"id": "r", "method": "POST", "url": "/me/messages/1/reply", "body": {}}], {})
+
+    assert len(fake.chunks) == (2 if retried else 1)
+    assert results["r"]["status"] == (202 if retried else status)
+
+
+@pytest.mark.parametrize("status", [503, 504])
+def test_get_sub_requests_are_retried_on_503_and_504(monkeypatch, sleeps, status):
+    fake = FakeGraph(lambda r, call: status if call == 1 else 200)
+    monkeypatch.setattr(graph_client, "graph_post", fake)
+
+    results = graph_batch(_gets(1), {})
+
+    assert len(fake.chunks) == 2
+    assert results["0"]["status"] == 200
+
+
+def test_failed_batch_call_marks_its_chunk_only(monkeypatch, sleeps):
+    fake = FakeGraph(batch_status=400)
+    monkeypatch.setattr(graph_client, "graph_post", fake)
+
+    results = graph_batch(_gets(3), {})
+
+    assert {r["status"] for r in results.values()} == {400}
+    assert results["0"]["body"] == "batch rejected"
+
+
+def test_network_error_marks_its_chunk_and_the_rest_still_goes_out(monkeypatch, sleeps):
+    fake = FakeGraph()
+
+    def flaky(url, headers=None, json=None):
+        if not fake.chunks:
+            fake.chunks.append([r["id"] for r in json["requests"]])
+            raise graph_client.requests.ConnectionError("connection reset")
+        return fake(url, headers=headers, json=json)
+
+    monkeypatch.setattr(graph_client, "graph_post", flaky)
+
+    results = graph_batch(_gets(GRAPH_BATCH_LIMIT + 2), {})
+
+    assert len(fake.chunks) == 2
+    assert {results[str(i)]["status"] for i in range(GRAPH_BATCH_LIMIT)} == {0}
+    assert "connection reset" in results["0"]["body"]
+    assert results[str(GRAPH_BATCH_LIMIT)]["status"] == 200
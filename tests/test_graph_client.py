@@ -0,0 +1,89 @@
+import pytest
+import requests
+
+import graph_client
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def close(self):
+        pass
+
+
+class FakeSession:
+    """Plays back the given responses (or raises the given exceptions) in order."""
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def request(self, method, url, timeout=None, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+    monkeypatch.setattr(graph_client.time, "sleep", slept.append)
+    return slept
+
+
+def _use(monkeypatch, session):
+    monkeypatch.setattr(graph_client, "get_graph_session", lambda: session)
+
+
+@pytest.mark.parametrize("method, status, expected", [
+    ("GET", 429, True),
+    ("get", 503, True),
+    ("GET", 504, True),
+    ("GET", 500, False),
+    ("POST", 429, True),
+    ("POST", 503, False),
+    ("PATCH", 504, False),
+])
+def test_retryable(method, status, expected):
+    assert graph_client._retryable(method, status) is expected
+
+
+def test_throttled_call_waits_for_retry_after(monkeypatch, sleeps):
+    session = FakeSession(FakeResponse(429, {"Retry-After": "4"}), FakeResponse(200))
+    _use(monkeypatch, session)
+
+    response = graph_client.graph_get("https://graph/me", max_retries=2)
+
+    assert response.status_code == 200
+    assert sleeps == [4.0]
+
+
+def test_last_retryable_response_is_returned(monkeypatch, sleeps):
+    session = FakeSession(FakeResponse(503), FakeResponse(503))
+    _use(monkeypatch, session)
+
+    response = graph_client.graph_get("https://graph/me", max_retries=1)
+
+    assert response.status_code == 503
+    assert session.calls == 2
+
+
+def test_get_is_resent_after_a_connection_error(monkeypatch, sleeps):
+    session = FakeSession(requests.ConnectionError("reset"), FakeResponse(200))
+    _use(monkeypatch, session)
+
+    assert graph_client.graph_get("https://graph/me").status_code == 200
+    assert session.calls == 2
+
+
+def test_post_is_not_resent_after_a_connection_error(monkeypatch, sleeps):
+    session = FakeSession(requests.ConnectionError("reset"), FakeResponse(202))
+    _use(monkeypatch, session)
+
+    with pytest.raises(requests.ConnectionError):
+        graph_client.graph_post("https://graph/me/messages/1/reply", json={})
+    assert session.calls == 1
+    assert sleeps == []
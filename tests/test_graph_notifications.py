@@ -0,0 +1,55 @@
+import pytest
+
+import graph_subscriptions
+from graph_subscriptions import is_valid_notification, parse_notifications
+
+
+@pytest.fixture(autouse=True)
+def client_state(monkeypatch):
+    monkeypatch.setattr(graph_subscriptions, "GRAPH_CLIENT_STATE", "s3cret")
+
+
+def _created(message_id, client_state="s3cret"):
+    return {
+        "subscriptionId": "sub",
+        "changeType": "created",
+        "clientState": client_state,
+        "resourceData": {"id": message_id},
+    }
+
+
+def test_created_notifications_yield_message_ids_in_order():
+    message_ids, events = parse_notifications({"value": [_created("a"), _created("b")]})
+    assert message_ids == ["a", "b"]
+    assert events == []
+
+
+def test_wrong_or_missing_client_state_is_dropped():
+    payload = {"value": [_created("a", "wrong"), _created("b", None), _created("c")]}
+    message_ids, _ = parse_notifications(payload)
+    assert message_ids == ["c"]
+
+
+def test_lifecycle_events_are_split_out():
+    payload = {"value": [
+        {"subscriptionId": "sub", "lifecycleEvent": "reauthorizationRequired", "clientState": "s3cret"},
+        _created("a"),
+        {"subscriptionId": "sub", "lifecycleEvent": "missed", "clientState": "wrong"},
+    ]}
+    message_ids, events = parse_notifications(payload)
+    assert message_ids == ["a"]
+    assert events == ["reauthorizationRequired"]
+
+
+def test_notification_without_resource_data_is_ignored():
+    message_ids, events = parse_notifications({"value": [{"clientState": "s3cret"}]})
+    assert (message_ids, events) == ([], [])
+
+
+def test_empty_payload():
+    assert parse_notifications({}) == ([], [])
+
+
+def test_nothing_is_valid_without_a_configured_client_state(monkeypatch):
+    monkeypatch.setattr(graph_subscriptions, "GRAPH_CLIENT_STATE", None)
+    assert not is_valid_notification({"clientState": ""})
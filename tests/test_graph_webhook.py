@@ -0,0 +1,88 @@
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+import graph_subscriptions
+import main
+
+
+@pytest.fixture
+def runs(monkeypatch):
+    monkeypatch.setattr(graph_subscriptions, "GRAPH_CLIENT_STATE", "s3cret")
+    requested = []
+    monkeypatch.setattr(main, "request_pipeline_run", lambda email_ids=None: requested.append(email_ids))
+    return requested
+
+
+@pytest.fixture
+def client():
+    # not used as a context manager: startup hooks (scheduler, subscription) stay off
+    return TestClient(main.app)
+
+
+def _created(message_id, client_state="s3cret"):
+    return {
+        "subscriptionId": "sub",
+        "changeType": "created",
+        "clientState": client_state,
+        "resourceData": {"id": message_id},
+    }
+
+
+def test_validation_token_is_echoed_as_plain_text(client, runs):
+    response = client.post("/graph/notifications", params={"validationToken": "abc 123"})
+
+    assert response.status_code == 200
+    assert response.text == "abc 123"
+    assert response.headers["content-type"].startswith("text/plain")
+    assert runs == []
+
+
+def test_created_notifications_are_accepted_and_queued(client, runs):
+    response = client.post("/graph/notifications", json={"value": [_created("a"), _created("b")]})
+
+    assert response.status_code == 202
+    assert runs == [["a", "b"]]
+
+
+def test_wrong_client_state_is_accepted_but_not_queued(client, runs):
+    response = client.post("/graph/notifications", json={"value": [_created("a", "forged")]})
+
+    assert response.status_code == 202
+    assert runs == []
+
+
+def test_invalid_json_is_rejected(client, runs):
+    response = client.post("/graph/notifications", content=b"not json",
+                           headers={"Content-Type": "application/json"})
+
+    assert response.status_code == 400
+    assert runs == []
+
+
+def test_missed_lifecycle_event_requests_a_full_sync(client, runs):
+    payload = {"value": [{"subscriptionId": "sub", "lifecycleEvent": "missed", "clientState": "s3cret"}]}
+
+    response = client.post("/graph/notifications", json=payload)
+
+    assert response.status_code == 202
+    assert runs == [None]
+
+
+def test_reauthorization_renews_the_subscription(client, runs, monkeypatch):
+    renewed = threading.Event()
+    calls = []
+
+    def refresh_subscription(**kwargs):
+        calls.append(kwargs)
+        renewed.set()
+
+    monkeypatch.setattr(main, "refresh_subscription", refresh_subscription)
+    payload = {"value": [{"subscriptionId": "sub", "lifecycleEvent": "reauthorizationRequired", "clientState": "s3cret"}]}
+
+    response = client.post("/graph/notifications", json=payload)
+
+    assert response.status_code == 202
+    assert renewed.wait(5)
+    assert calls == [{"force_renew": True}]
@@ -0,0 +1,102 @@
+import pytest
+
+from odoo_services import product_service
+from odoo_services.utils import invalidate_reference_cache
+
+
+class FakeOdoo:
+    """Records execute_kw calls and answers from in-memory product data."""
+    def __init__(self, templates=(), technologies=(), categories=()):
+        self.calls = []
+        self.templates = list(templates)  # {"id", "default_code", "name", "product_variant_ids"}
+        self.technologies = dict(technologies)  # name -> id
+        self.categories = dict(categories)  # name -> id
+        self.created_templates = []
+        self.created_technologies = []
+
+    def execute_kw(self, model, method, args, kwargs=None):
+        self.calls.append((model, method))
+        if (model, method) == ('product.template', 'search_read'):
+            codes = args[0][0][2]
+            return [t for t in self.templates if t['default_code'] in codes]
+        if (model, method) == ('x_technology', 'search_read'):
+            return [{'id': self.technologies[n], 'x_name': n} for n in args[0][0][2] if n in self.technologies]
+        if (model, method) == ('x_technology', 'create'):
+            self.created_technologies.extend(v['x_name'] for v in args[0])
+            return [500 + i for i in range(len(args[0]))]
+        if (model, method) == ('product.category', 'search_read'):
+            return [{'id': self.categories[n], 'name': n} for n in args[0][0][2] if n in self.categories]
+        if (model, method) == ('product.template', 'create'):
+            self.created_templates.extend(args[0])
+            return [200 + i for i in range(len(args[0]))]
+        if (model, method) == ('product.product', 'search_read'):
+            return [{'id': tmpl_id + 1000, 'product_tmpl_id': [tmpl_id, 'x']} for tmpl_id in args[0][0][2]]
+        raise AssertionError(f"unexpected call {model}.{method}")
+
+
+@pytest.fixture(autouse=True)
+def fresh_reference_cache():
+    invalidate_reference_cache()
+    yield
+    invalidate_reference_cache()
+
+
+def _spec(ref, description=None, technology=None, category=None, type=None):
+    return {
+        "internal_reference": ref,
+        "description": description or f"desc {ref}",
+        "type": type,
+        "category": category,
+        "technology": technology,
+    }
+
+
+def test_existing_products_cost_one_rpc(monkeypatch):
+    odoo = FakeOdoo(templates=[
+        {'id': 1, 'default_code': 'A', 'name': 'Product A', 'product_variant_ids': [11]},
+        {'id': 2, 'default_code': 'B', 'name': 'Product B', 'product_variant_ids': [12, 13]},
+    ])
+    monkeypatch.setattr(product_service, "odoo", odoo)
+    names = {}
+
+    product_map = product_service.get_or_create_products([_spec('A'), _spec('B'), _spec('A')], names)
+
+    assert product_map == {'A': 11, 'B': 12}
+    assert names == {11: 'Product A', 12: 'Product B'}
+    assert odoo.calls == [('product.template', 'search_read')]
+
+
+def test_missing_products_are_created_in_one_call(monkeypatch):
+    odoo = FakeOdoo(
+        templates=[{'id': 1, 'default_code': 'A', 'name': 'Product A', 'product_variant_ids': [11]}],
+        technologies={'Cisco': 7},
+        categories={'EX - License': 3},
+    )
+    monkeypatch.setattr(product_service, "odoo", odoo)
+    names = {}
+
+    product_map = product_service.get_or_create_products([
+        _spec('A'),
+        _spec('B', technology='Cisco', category='EX - License', type='Service'),
+        _spec('C', technology='Fortinet'),
+        _spec('B', description='ignored duplicate'),
+    ], names)
+
+    assert odoo.calls.count(('product.template', 'create')) == 1
+    assert [v['default_code'] for v in odoo.created_templates] == ['B', 'C']
+    created_b, created_c = odoo.created_templates
+    assert created_b['name'] == 'desc B'
+    assert created_b['type'] == 'service'
+    assert created_b['x_technology_id'] == 7
+    assert created_b['categ_id'] == 3
+    assert created_c['x_technology_id'] == 500  # created, not found
+    assert odoo.created_technologies == ['Fortinet']
+    assert product_map == {'A': 11, 'B': 1200, 'C': 1201}
+    assert names[1200] == 'desc B'
+
+
+def test_no_specs_no_rpc(monkeypatch):
+    odoo = FakeOdoo()
+    monkeypatch.setattr(product_service, "odoo", odoo)
+    assert product_service.get_or_create_products([]) == {}
+    assert odoo.calls == []
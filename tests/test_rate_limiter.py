@@ -0,0 +1,111 @@
+import asyncio
+import time
+
+import pytest
+
+from llm_services.llm_parser import RateLimiter, _TokenBucket, _parse_reset
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("1s", 1.0),
+    ("20ms", 0.02),
+    ("6m0s", 360.0),
+    ("1h2m3s", 3723.0),
+    ("1.5s", 1.5),
+    ("7", 7.0),
+    ("", None),
+    (None, None),
+    ("soon", None),
+])
+def test_parse_reset(value, expected):
+    if expected is None:
+        assert _parse_reset(value) is None
+    else:
+        assert _parse_reset(value) == pytest.approx(expected)
+
+
+def test_bucket_wait_time_after_draining():
+    bucket = _TokenBucket(60)  # one per second
+    now = bucket.updated
+    assert bucket.wait_time(60, now) == 0
+    bucket.take(60)
+    assert bucket.wait_time(1, now) == pytest.approx(1.0)
+    # half a second later half a token has come back
+    assert bucket.wait_time(1, now + 0.5) == pytest.approx(0.5)
+
+
+def test_bucket_refill_is_capped_at_capacity():
+    bucket = _TokenBucket(60)
+    bucket.take(30)
+    bucket._refill(bucket.updated + 3600)
+    assert bucket.available == 60
+
+
+def test_bucket_request_larger_than_capacity_does_not_wait_forever():
+    bucket = _TokenBucket(100)
+    assert bucket.wait_time(10_000, bucket.updated) == 0
+
+
+def test_bucket_sync_follows_headers():
+    bucket = _TokenBucket(100)
+    bucket.sync(500, 20)
+    assert bucket.capacity == 500
+    assert bucket.available == 20
+    # remaining never raises what we already know is used
+    bucket.sync(None, 400)
+    assert bucket.available == 20
+
+
+def test_update_from_headers_ignores_missing_and_garbage():
+    limiter = RateLimiter(rpm=60, tpm=1000)
+    limiter.update_from_headers({
+        "x-ratelimit-limit-requests": "120",
+        "x-ratelimit-remaining-requests": "5",
+        "x-ratelimit-limit-tokens": "n/a",
+    })
+    assert limiter.requests.capacity == 120
+    assert limiter.requests.available == 5
+    assert limiter.tokens.capacity == 1000
+    assert limiter.tokens.available == 1000
+
+
+def test_acquire_takes_one_request_and_the_reserved_tokens():
+    limiter = RateLimiter(rpm=60, tpm=1000)
+    asyncio.run(limiter.acquire(300))
+    assert limiter.requests.available == pytest.approx(59, abs=0.01)
+    assert limiter.tokens.available == pytest.approx(700, abs=1)
+
+
+def test_settle_charges_only_the_difference():
+    limiter = RateLimiter(rpm=60, tpm=1000)
+    limiter.tokens.take(300)
+    limiter.settle(reserved=300, used=100)
+    assert limiter.tokens.available == pytest.approx(900)
+    limiter.settle(reserved=100, used=400)
+    assert limiter.tokens.available == pytest.approx(600)
+
+
+def test_block_for_prefers_retry_after():
+    limiter = RateLimiter(rpm=60, tpm=1000)
+    before = time.monotonic()
+    assert limiter.block_for({"retry-after": "2", "x-ratelimit-reset-requests": "30s"}) == 2
+    assert limiter.blocked_until >= before + 2
+
+
+def test_block_for_uses_the_longer_reset_window():
+    limiter = RateLimiter(rpm=60, tpm=1000)
+    delay = limiter.block_for({"x-ratelimit-reset-requests": "1s", "x-ratelimit-reset-tokens": "6m0s"})
+    assert delay == 360
+
+
+def test_block_for_defaults_to_one_second():
+    limiter = RateLimiter(rpm=60, tpm=1000)
+    assert limiter.block_for({}) == 1.0
+
+
+def test_acquire_waits_while_blocked():
+    limiter = RateLimiter(rpm=60, tpm=1000)
+    limiter.blocked_until = time.monotonic() + 0.1
+    start = time.monotonic()
+    asyncio.run(limiter.acquire(1))
+    assert time.monotonic() - start >= 0.1
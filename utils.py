@@ -1,28 +1,150 @@
-import xmlrpc.client
-from config import ODOO_URL, ODOO_DB, ODOO_USERNAME, ODOO_PASSWORD
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from config import ODOO_DB, ODOO_USERNAME, ODOO_PASSWORD, REFERENCE_CACHE_TTL
+from odoo_services.odoo_rpc import OdooRPCError, OdooRPCProxy
 
-def get_odoo_connection():
-    common = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/common")
-    uid = common.authenticate(ODOO_DB, ODOO_USERNAME, ODOO_PASSWORD, {})
+class OdooSession:
+    """
+    One Odoo login for the whole process. Nothing is sent until the first call;
+    the uid is cached and the session logs in again once if Odoo denies access.
+    Services call execute_kw(model, method, args, kwargs); db, uid and password
+    are the session's own.
+    """
+    def __init__(self, db=ODOO_DB, username=ODOO_USERNAME, password=ODOO_PASSWORD):
+        self.db = db
+        self.username = username
+        self.password = password
+        self._common = OdooRPCProxy("common")  # pooled keep-alive transport, thread-safe
+        self._object = OdooRPCProxy("object")
+        self._uid = None
+        self._lock = threading.Lock()
 
-    if not uid:
-        raise Exception("Failed to authenticate with Odoo. Check credentials.")
+    @property
+    def uid(self):
+        if self._uid is None:
+            with self._lock:
+                if self._uid is None:
+                    self._uid = self._authenticate()
+        return self._uid
 
-    models = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/object")
-    return models, ODOO_DB, uid, ODOO_PASSWORD
+    def _authenticate(self):
+        uid = self._common.authenticate(self.db, self.username, self.password, {})
+        if not uid:
+            raise Exception("Failed to authenticate with Odoo. Check credentials.")
+        print(f"[🔐 Odoo] Authenticated as uid {uid}")
+        return uid
 
+    def invalidate(self, stale_uid=None):
+        with self._lock:
+            if stale_uid is None or self._uid == stale_uid:
+                self._uid = None
 
-def currency(models, db, uid, password, currency_code):
+    def execute_kw(self, model, method, args, kwargs=None):
+        args = (model, method, args, kwargs or {})
+        session_uid = self.uid
+        try:
+            return self._object.execute_kw(self.db, session_uid, self.password, *args)
+        except OdooRPCError as e:
+            if "Access Denied" not in str(e) and "Session expired" not in str(e):
+                raise
+            print("[🔐 Odoo] Session rejected — re-authenticating")
+            self.invalidate(session_uid)
+            return self._object.execute_kw(self.db, self.uid, self.password, *args)
 
-    currency_ids = models.execute_kw(
-        db, uid, password,
-        'res.currency', 'search',
-        [[['name', '=', currency_code]]],  
-        {'limit': 1}
-    )
-    if not currency_ids:
+_session = None
+_session_lock = threading.Lock()
+
+def get_odoo_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = OdooSession()
+    return _session
+
+
+# === NAMED LOCKS ===
+# Odoo search-then-create is not atomic. Threads that may create the same record
+# (same SO, vendor name, product default_code) take the same process-wide lock first.
+_named_locks = {}  # (kind, name) -> Lock
+_named_locks_lock = threading.Lock()
+
+def named_lock(kind, name):
+    with _named_locks_lock:
+        return _named_locks.setdefault((kind, name), threading.Lock())
+
+@contextmanager
+def named_locks(kind, names):
+    # always taken in sorted order, so callers with overlapping names cannot deadlock
+    with ExitStack() as stack:
+        for name in sorted(set(names), key=str):
+            stack.enter_context(named_lock(kind, name))
+        yield
+
+
+# === REFERENCE DATA CACHE ===
+# Currencies, UoMs, taxes, payment terms, countries, states and categories barely
+# change, so lookups are kept for REFERENCE_CACHE_TTL seconds instead of hitting Odoo per SO.
+_reference_cache = {}  # (kind, *args) -> (expires_at, value)
+_reference_lock = threading.Lock()
+
+def get_cached_reference(key):
+    with _reference_lock:
+        hit = _reference_cache.get(key)
+    if hit and hit[0] > time.monotonic():
+        return hit[1]
+    return None
+
+def set_cached_reference(key, value, ttl=None):
+    # misses are not cached so newly created master data shows up on the next call
+    if value:
+        with _reference_lock:
+            _reference_cache[key] = (time.monotonic() + (ttl or REFERENCE_CACHE_TTL), value)
+
+def cached_reference(key, loader, ttl=None):
+    value = get_cached_reference(key)
+    if value is None:
+        value = loader()
+        set_cached_reference(key, value, ttl)
+    return value
+
+def invalidate_reference_cache(kind=None):
+    with _reference_lock:
+        if kind is None:
+            _reference_cache.clear()
+        else:
+            for key in [k for k in _reference_cache if k[0] == kind]:
+                del _reference_cache[key]
+
+def warm_reference_cache(odoo, currency_codes=("SAR", "USD", "EUR", "GBP", "AED")):
+    for code in currency_codes:
+        try:
+            currency(odoo, code)
+        except Exception as e:
+            print(f"[⚠️ Warm-up] {e}")
+    get_UoM(odoo)
+
+    # imported here: purchase_service itself imports this module
+    from odoo_services.purchase_service import get_payment_term_id, get_vat_tax_id
+    get_vat_tax_id()
+    get_payment_term_id('2 Months')
+    print("[🔥 Reference cache warmed]")
+
+
+def currency(odoo, currency_code):
+
+    def _load():
+        currency_ids = odoo.execute_kw(
+            'res.currency', 'search',
+            [[['name', '=', currency_code]]],  
+            {'limit': 1}
+        )
+        return currency_ids[0] if currency_ids else None
+
+    currency_id = cached_reference(("currency", currency_code), _load)
+    if not currency_id:
         raise Exception(f"Currency {currency_code} not found.")
-    return currency_ids[0]
+    return currency_id
 
 def get_currency_code(quotation, default="SAR"):
     for item in quotation.get("Items", []):
@@ -30,16 +152,15 @@ def get_currency_code(quotation, default="SAR"):
             return item["Currency"]
     return default  # fallback if none of the items have a currency
 
-def get_UoM(models, db, uid, password):
+def get_UoM(odoo):
     
-      # get UoM ID for "Units"
-            unit_uom_ids = models.execute_kw(
-                db, uid, password,
-                'uom.uom', 'search',
-                [[['name', '=', 'Units']]],
-                {'limit': 1}
-            )
-            unit_uom_id = unit_uom_ids[0] if unit_uom_ids else None
-            
-            return unit_uom_id
-            
\ No newline at end of file
+    def _load():
+        # get UoM ID for "Units"
+        unit_uom_ids = odoo.execute_kw(
+            'uom.uom', 'search',
+            [[['name', '=', 'Units']]],
+            {'limit': 1}
+        )
+        return unit_uom_ids[0] if unit_uom_ids else None
+
+    return cached_reference(("uom", "Units"), _load)
@@ -1,7 +1,7 @@
 from Post_processing.business_rules import get_country_id, get_state_id, map_sector
-from odoo_services.utils import get_odoo_connection
+from odoo_services.utils import get_odoo_session
 
-models, db, uid, password = get_odoo_connection()
+odoo = get_odoo_session()  # lazy: no login at import
 
 def get_or_create_vendor(vendor_dict):
     vendor_name = vendor_dict.get("name")
@@ -21,8 +21,7 @@ def get_or_create_vendor(vendor_dict):
 
 
     # Check if vendor exists
-    partner_ids = models.execute_kw(
-        db, uid, password,
+    partner_ids = odoo.execute_kw(
         'res.partner', 'search',
         [[['name', '=', vendor_name], ['company_type', '=', 'company']]],
         {'limit': 1}
@@ -38,23 +37,21 @@ def get_or_create_vendor(vendor_dict):
     
 
     # Lookup country_id and state_id
-    country_id = get_country_id(models, db, uid, password, country_code)
-    state_id = get_state_id(models, db, uid, password, state_name, country_id)
+    country_id = get_country_id(odoo, country_code)
+    state_id = get_state_id(odoo, state_name, country_id)
 
                 
     # Lookup or create tags
     # tag_names = vendor_dict.get("tags", [])
     # tag_ids = []
     # for tag_name in tag_names:
-    #     tag_id = models.execute_kw(
-    #         db, uid, password,
+    #     tag_id = odoo.execute_kw(
     #         'res.partner.category', 'search',
     #         [[['name', '=', tag_name]]],
     #         {'limit': 1}
     #     )
     #     if not tag_id:
-    #         tag_id = [models.execute_kw(
-    #             db, uid, password,
+    #         tag_id = [odoo.execute_kw(
     #             'res.partner.category', 'create',
     #             [{'name': tag_name}]
     #         )]
@@ -86,8 +83,7 @@ def get_or_create_vendor(vendor_dict):
     vendor_vals = {k: v for k, v in vendor_vals.items() if v is not None}
 
     # Create vendor
-    partner_id = models.execute_kw(
-        db, uid, password,
+    partner_id = odoo.execute_kw(
         'res.partner', 'create',
         [vendor_vals]
     )